@@ -30,10 +30,168 @@ options:
     default: sso.redhat.com
     vars:
       - name: ansible_httpapi_consoledot_token_domain
+  token_cache:
+    type: bool
+    description:
+      - Cache the SSO access token on disk so that new persistent connections,
+        including those started by other ansible-playbook processes, can reuse
+        it instead of requesting a new one.
+    default: true
+    vars:
+      - name: ansible_httpapi_consoledot_token_cache
+  token_cache_dir:
+    type: path
+    description:
+      - Directory the SSO access token cache is stored in.
+    default: ~/.ansible/consoledot
+    vars:
+      - name: ansible_httpapi_consoledot_token_cache_dir
+  token_refresh_margin:
+    type: int
+    description:
+      - Number of seconds before the access token expires at which it is
+        considered stale and a new one is requested.
+    default: 60
+    vars:
+      - name: ansible_httpapi_consoledot_token_refresh_margin
+  pool_size:
+    type: int
+    description:
+      - Maximum number of keep-alive HTTPS connections to console.redhat.com
+        kept open by the persistent connection and reused across requests.
+      - Set to C(0) to open a new connection for every request instead.
+      - Pooled connections honour I(validate_certs), I(use_proxy) and
+        I(ciphers) of the httpapi connection and log requests with
+        I(persistent_log_messages). Proxies reached over HTTPS, such as
+        C(https_proxy=https://proxy.example.com), are not supported, set C(0)
+        to use them.
+    default: 4
+    vars:
+      - name: ansible_httpapi_consoledot_pool_size
+  pool_idle_timeout:
+    type: int
+    description:
+      - Number of seconds an unused pooled connection is kept before it is
+        closed and replaced by a new one.
+    default: 30
+    vars:
+      - name: ansible_httpapi_consoledot_pool_idle_timeout
+  retries:
+    type: int
+    description:
+      - Number of times a request is retried after a retryable status code or
+        a connection error.
+      - Only idempotent requests (C(GET), C(HEAD), C(PUT), C(DELETE)) are
+        retried, except for HTTP 429 which is retried for every method since
+        the server rejected the request without processing it.
+    default: 3
+    vars:
+      - name: ansible_httpapi_consoledot_retries
+  retry_status_codes:
+    type: list
+    elements: int
+    description:
+      - HTTP status codes that cause a request to be retried.
+    default: [429, 500, 502, 503, 504]
+    vars:
+      - name: ansible_httpapi_consoledot_retry_status_codes
+  retry_backoff:
+    type: float
+    description:
+      - Base delay in seconds of the exponential backoff between retries, a
+        random jitter of up to the full delay is applied.
+      - A C(Retry-After) header sent by the server takes precedence.
+    default: 1.0
+    vars:
+      - name: ansible_httpapi_consoledot_retry_backoff
+  retry_backoff_max:
+    type: float
+    description:
+      - Maximum delay in seconds between two retries.
+      - When the server asks with C(Retry-After) to wait longer than this, the
+        request is not retried and its response is returned, a persistent
+        connection sleeping that long would exceed its command timeout.
+    default: 30.0
+    vars:
+      - name: ansible_httpapi_consoledot_retry_backoff_max
+  rate_limits:
+    type: dict
+    description:
+      - Maximum number of requests per second sent to each family of
+        console.redhat.com endpoints, keyed by family.
+      - Valid keys are C(devices), C(inventory), C(updates), C(image_builder)
+        and C(default) for every other endpoint.
+      - The limits are shared by every persistent connection and every
+        ansible-playbook process using the same I(rate_limit_state_dir), so
+        that all forks respect one global budget.
+      - Families without a limit are not rate limited.
+    default: {}
+    vars:
+      - name: ansible_httpapi_consoledot_rate_limits
+  rate_limit_burst:
+    type: int
+    description:
+      - Number of requests of a family that may be sent back to back before
+        the rate limit applies. Defaults to one second worth of requests.
+    vars:
+      - name: ansible_httpapi_consoledot_rate_limit_burst
+  rate_limit_state_dir:
+    type: path
+    description:
+      - Directory the shared rate limiter state is stored in.
+    default: ~/.ansible/consoledot
+    vars:
+      - name: ansible_httpapi_consoledot_rate_limit_state_dir
+  http_cache_size:
+    type: int
+    description:
+      - Number of GET responses carrying an C(ETag) or C(Last-Modified)
+        validator kept by the persistent connection, least recently used
+        responses are dropped first.
+      - Cached responses are revalidated with C(If-None-Match) or
+        C(If-Modified-Since) and reused when the server answers
+        C(304 Not Modified).
+      - Set to C(0) to disable the cache.
+    default: 128
+    vars:
+      - name: ansible_httpapi_consoledot_http_cache_size
+  http_cache_dir:
+    type: path
+    description:
+      - Directory to also keep the cached responses in, so that they survive
+        the persistent connection. Holds at most I(http_cache_size) responses.
+      - Responses are only cached in memory when not set.
+    vars:
+      - name: ansible_httpapi_consoledot_http_cache_dir
+  batch_workers:
+    type: int
+    description:
+      - Maximum number of requests of a batch, submitted by a module in a
+        single call to the persistent connection, that are sent concurrently.
+      - Only used when the module does not set its own limit, such as the
+        I(max_parallel) option of the update_systems module.
+      - Requests beyond I(pool_size) wait for a pooled connection to be free.
+    default: 4
+    vars:
+      - name: ansible_httpapi_consoledot_batch_workers
 """
 
+import base64
+import fcntl
+import hashlib
 import json
+import os
+import random
+import socket
+import ssl
+import tempfile
+import threading
 import time
+import zlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from email.utils import mktime_tz, parsedate_tz
 
 from ansible.module_utils.basic import to_text, to_bytes, to_native
 from ansible.errors import AnsibleConnectionFailure
@@ -41,17 +199,437 @@ from ansible.module_utils.six.moves.urllib.error import HTTPError
 from ansible.plugins.httpapi import HttpApiBase
 from ansible.module_utils.connection import ConnectionError
 from ansible.module_utils.urls import Request
-from ansible.module_utils.six.moves.urllib.parse import urlencode
+from ansible.module_utils.six.moves import http_client
+from ansible.module_utils.six.moves.urllib.parse import urlencode, urlparse
+from ansible.module_utils.six.moves.urllib.request import getproxies, proxy_bypass
 from ansible.utils.display import Display
 
+try:
+    import orjson
+
+    json_loads = orjson.loads
+except ImportError:
+    json_loads = json.loads
+
 display = Display()
 
 BASE_HEADERS = {
     "Content-Type": "application/json",
 }
 
+IDEMPOTENT_METHODS = frozenset(["GET", "HEAD", "OPTIONS", "PUT", "DELETE"])
+
+GZIP_MAGIC = b"\x1f\x8b"
+
+RATE_LIMIT_FAMILIES = (
+    ("devices", ("/api/edge/v1/devices",)),
+    ("inventory", ("/api/inventory/",)),
+    ("updates", ("/api/edge/v1/updates",)),
+    ("image_builder", ("/api/image-builder/",)),
+)
+
+
+def _rate_limit_family(path):
+    for family, prefixes in RATE_LIMIT_FAMILIES:
+        if path.startswith(prefixes):
+            return family
+    return "default"
+
+
+@contextmanager
+def _locked_file(path):
+    """Hold an exclusive advisory lock on ``path`` for the duration of the block."""
+    with open(path, "a") as lock_file:
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+
+def _parse_retry_after(value):
+    """Return the number of seconds a Retry-After header asks to wait, if any."""
+    if not value:
+        return None
+    try:
+        return max(float(value), 0)
+    except ValueError:
+        pass
+    retry_at = parsedate_tz(value)
+    if retry_at is None:
+        return None
+    return max(mktime_tz(retry_at) - time.time(), 0)
+
+
+def _decompressor(content_encoding):
+    content_encoding = (content_encoding or "").strip().lower()
+    if content_encoding in ("gzip", "x-gzip"):
+        return zlib.decompressobj(16 + zlib.MAX_WBITS)
+    if content_encoding == "deflate":
+        return zlib.decompressobj()
+    return None
+
+
+def _decompress(content_encoding, data):
+    """Decode a response body read in one go, urllib may already have
+    decompressed gzip bodies while leaving the Content-Encoding header."""
+    content_encoding = (content_encoding or "").strip().lower()
+    if content_encoding in ("gzip", "x-gzip") and not data.startswith(GZIP_MAGIC):
+        return data
+    decompressor = _decompressor(content_encoding)
+    if decompressor is None or not data:
+        return data
+    try:
+        return decompressor.decompress(data) + decompressor.flush()
+    except zlib.error:
+        # Some servers send raw deflate streams without the zlib header
+        decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+        return decompressor.decompress(data) + decompressor.flush()
+
+
+def _write_json_atomic(path, data):
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+    try:
+        with os.fdopen(fd, "w") as tmp_file:
+            json.dump(data, tmp_file)
+        os.chmod(tmp_path, 0o600)
+        os.replace(tmp_path, path)
+    except Exception:
+        os.unlink(tmp_path)
+        raise
+
+
+class _RateLimiter(object):
+    """Token buckets whose state lives in a locked file so that every process
+    talking to console.redhat.com draws from the same budget."""
+
+    def __init__(self, state_path, limits, burst=None):
+        self.state_path = state_path
+        self.limits = limits
+        self.burst = burst
+
+    def _read_state(self):
+        try:
+            with open(self.state_path) as state_file:
+                return json.load(state_file)
+        except (IOError, OSError, ValueError):
+            return {}
+
+    def acquire(self, family):
+        """Take a token from the bucket of ``family``, sleeping until it is
+        available, and return the number of seconds waited."""
+        rate = float(self.limits.get(family) or 0)
+        if rate <= 0:
+            return 0
+        capacity = self.burst or max(rate, 1)
+
+        with _locked_file(self.state_path + ".lock"):
+            now = time.time()
+            state = self._read_state()
+            tokens, updated_at = state.get(family, (capacity, now))
+            # Tokens may go negative, which reserves a slot in the future and
+            # avoids waiting processes racing each other for the next token.
+            tokens = min(capacity, tokens + (now - updated_at) * rate) - 1
+            state[family] = (tokens, now)
+            _write_json_atomic(self.state_path, state)
+
+        wait = -tokens / rate if tokens < 0 else 0
+        if wait:
+            time.sleep(wait)
+        return wait
+
+
+class _ResponseCache(object):
+    """LRU cache of GET response bodies and their validators, optionally
+    backed by a directory."""
+
+    def __init__(self, size, cache_dir=None):
+        self.size = size
+        self.cache_dir = cache_dir
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        if cache_dir and not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir, mode=0o700)
+
+    def _entry_path(self, key):
+        return os.path.join(self.cache_dir, "%s.json" % key)
+
+    def get(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key]
+        if not self.cache_dir:
+            return None
+        try:
+            with open(self._entry_path(key)) as entry_file:
+                entry = json.load(entry_file)
+        except (IOError, OSError, ValueError):
+            return None
+        self._remember(key, entry)
+        return entry
+
+    def _remember(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def put(self, key, entry):
+        self._remember(key, entry)
+        if not self.cache_dir:
+            return
+        _write_json_atomic(self._entry_path(key), entry)
+        entry_paths = [
+            os.path.join(self.cache_dir, name)
+            for name in os.listdir(self.cache_dir)
+            if name.endswith(".json")
+        ]
+        if len(entry_paths) > self.size:
+            entry_paths.sort(key=os.path.getmtime)
+            for entry_path in entry_paths[: len(entry_paths) - self.size]:
+                try:
+                    os.unlink(entry_path)
+                except OSError:
+                    pass
+
+
+class _ConnectionPool(object):
+    """Keep-alive connections to a single host, shared by every request made
+    through the persistent connection."""
+
+    # Errors raised when the server closed an idle keep-alive socket before
+    # the request reached it, those are safe to send again on a new socket.
+    STALE_CONNECTION_ERRORS = (
+        http_client.BadStatusLine,
+        ConnectionResetError,
+        BrokenPipeError,
+    )
+
+    def __init__(
+        self,
+        url,
+        size,
+        idle_timeout,
+        timeout,
+        validate_certs=True,
+        use_proxy=True,
+        ciphers=None,
+    ):
+        parsed_url = urlparse(url)
+        self.scheme = parsed_url.scheme
+        self.host = parsed_url.hostname
+        self.port = parsed_url.port
+        self.timeout = timeout
+        self.idle_timeout = idle_timeout
+
+        self._context = None
+        if self.scheme == "https":
+            self._context = ssl.create_default_context()
+            if not validate_certs:
+                self._context.check_hostname = False
+                self._context.verify_mode = ssl.CERT_NONE
+            if ciphers:
+                self._context.set_ciphers(
+                    ":".join(ciphers) if isinstance(ciphers, list) else ciphers
+                )
+
+        self._proxy = None
+        if use_proxy and self.scheme == "https" and not proxy_bypass(self.host):
+            proxy_url = getproxies().get("https")
+            if proxy_url:
+                self._proxy = urlparse(proxy_url)
+
+        self._idle = []
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(size)
+
+    def _new_connection(self):
+        if self.scheme != "https":
+            return http_client.HTTPConnection(
+                self.host, self.port, timeout=self.timeout
+            )
+
+        if self._proxy is None:
+            return http_client.HTTPSConnection(
+                self.host, self.port, timeout=self.timeout, context=self._context
+            )
+
+        connection = http_client.HTTPSConnection(
+            self._proxy.hostname,
+            self._proxy.port or (443 if self._proxy.scheme == "https" else 80),
+            timeout=self.timeout,
+            context=self._context,
+        )
+        tunnel_headers = {}
+        if self._proxy.username:
+            credentials = "%s:%s" % (self._proxy.username, self._proxy.password or "")
+            tunnel_headers["Proxy-Authorization"] = "Basic %s" % to_text(
+                base64.b64encode(to_bytes(credentials))
+            )
+        connection.set_tunnel(self.host, self.port, headers=tunnel_headers)
+        return connection
+
+    def _checkout(self):
+        now = time.time()
+        with self._lock:
+            while self._idle:
+                connection, released_at = self._idle.pop()
+                if now - released_at < self.idle_timeout:
+                    return connection, True
+                connection.close()
+        return self._new_connection(), False
+
+    def _checkin(self, connection, response):
+        if response.will_close:
+            connection.close()
+            return
+        with self._lock:
+            self._idle.append((connection, time.time()))
+
+    READ_CHUNK_SIZE = 64 * 1024
+
+    @classmethod
+    def _roundtrip(cls, connection, method, path, body, headers):
+        connection.request(method, path, body=body, headers=headers)
+        response = connection.getresponse()
+        decompressor = _decompressor(response.getheader("Content-Encoding"))
+        if decompressor is None:
+            return response, response.read()
+
+        # Decompress while reading so that the compressed body is never held
+        # in memory as a whole
+        chunks = []
+        while True:
+            chunk = response.read(cls.READ_CHUNK_SIZE)
+            if not chunk:
+                break
+            chunks.append(decompressor.decompress(chunk))
+        chunks.append(decompressor.flush())
+        return response, b"".join(chunks)
+
+    def request(self, method, path, body=None, headers=None):
+        """Send a request and return its status code, headers and raw body."""
+        headers = headers or {}
+        with self._slots:
+            connection, reused = self._checkout()
+            try:
+                try:
+                    response, response_data = self._roundtrip(
+                        connection, method, path, body, headers
+                    )
+                except self.STALE_CONNECTION_ERRORS as e:
+                    connection.close()
+                    # A reset may come after the server processed the
+                    # request, other requests are only replayed when the
+                    # server hung up without answering
+                    replayable = method.upper() in IDEMPOTENT_METHODS or isinstance(
+                        e, http_client.RemoteDisconnected
+                    )
+                    if not reused or not replayable:
+                        raise
+                    connection = self._new_connection()
+                    response, response_data = self._roundtrip(
+                        connection, method, path, body, headers
+                    )
+            except Exception:
+                connection.close()
+                raise
+            self._checkin(connection, response)
+        return response.status, response.msg, response_data
+
+    def close(self):
+        with self._lock:
+            while self._idle:
+                self._idle.pop()[0].close()
+
 
 class HttpApi(HttpApiBase):
+    def __init__(self, connection):
+        super(HttpApi, self).__init__(connection)
+        self._token = None
+        self._token_lock = threading.Lock()
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        self._rate_limiter = None
+        self._response_cache = None
+        self._response_cache_lock = threading.Lock()
+
+    def _token_cache_path(self):
+        cache_dir = os.path.expanduser(self.get_option("token_cache_dir"))
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir, mode=0o700)
+        cache_key = hashlib.sha256(
+            to_bytes(
+                "%s:%s"
+                % (self.get_option("token_domain"), self.get_option("offline_token"))
+            )
+        ).hexdigest()
+        return os.path.join(cache_dir, "token-%s.json" % cache_key)
+
+    def _token_is_fresh(self, token):
+        return token.get("expires_at", 0) - self.get_option(
+            "token_refresh_margin"
+        ) > time.time()
+
+    def _read_cached_token(self, cache_path):
+        try:
+            with open(cache_path) as cache_file:
+                token = json.load(cache_file)
+        except (IOError, OSError, ValueError):
+            return None
+        return token if self._token_is_fresh(token) else None
+
+    def _request_token(self):
+        request = Request()
+        token_request_form_data = {
+            "grant_type": "refresh_token",
+            "client_id": "rhsm-api",
+            "refresh_token": self.get_option("offline_token"),
+        }
+
+        result = []
+        for key, values in token_request_form_data.items():
+            values = [values]
+            for value in values:
+                if value is not None:
+                    result.append((to_text(key), to_text(value)))
+
+        requested_at = time.time()
+        results = json.load(
+            request.open(
+                "POST",
+                "https://%s/auth/realms/redhat-external/protocol/openid-connect/token"
+                % self.get_option("token_domain"),
+                data=to_text(urlencode(result, doseq=True)),
+            )
+        )
+
+        return {
+            "access_token": to_text(results["access_token"]),
+            "expires_at": requested_at + int(results.get("expires_in", 0)),
+        }
+
+    def _get_token(self, rejected=None):
+        if not self.get_option("token_cache"):
+            return self._request_token()
+
+        cache_path = self._token_cache_path()
+        # Holding the lock while talking to the SSO means concurrent
+        # ansible-playbook processes wait for one refresh instead of all
+        # requesting their own token.
+        with _locked_file(cache_path + ".lock"):
+            token = self._read_cached_token(cache_path)
+            if token is None or token["access_token"] == rejected:
+                token = self._request_token()
+                _write_json_atomic(cache_path, token)
+        display.vvvv(
+            "consoledot: using access token valid until %s"
+            % time.ctime(token["expires_at"])
+        )
+        return token
+
     def _hack_the_auth(self):
         # I am committing sins against humanity because the Red Hat SSO does
         # not just use straight API keys but instead an API auth key that will
@@ -59,63 +637,343 @@ class HttpApi(HttpApiBase):
         # That secondary API key can actually be used to talk to REST APIs
         # in console.redhat.com
         #   Docs: https://access.redhat.com/articles/3626371
-        if not self.connection._auth and self.get_option("offline_token"):
-            request = Request()
-            token_request_form_data = {
-                "grant_type": "refresh_token",
-                "client_id": "rhsm-api",
-                "refresh_token": self.get_option("offline_token"),
-            }
+        if not self.get_option("offline_token"):
+            return
 
-            result = []
-            for key, values in token_request_form_data.items():
-                values = [values]
-                for value in values:
-                    if value is not None:
-                        result.append((to_text(key), to_text(value)))
-
-            results = json.load(
-                request.open(
-                    "POST",
-                    "https://%s/auth/realms/redhat-external/protocol/openid-connect/token"
-                    % self.get_option("token_domain"),
-                    data=to_text(urlencode(result, doseq=True)),
-                )
+        with self._token_lock:
+            if (
+                self.connection._auth
+                and self._token is not None
+                and self._token_is_fresh(self._token)
+            ):
+                return
+            self._set_token(self._get_token())
+
+    def _set_token(self, token):
+        self._token = token
+        self.connection._auth = {
+            "Authorization": "Bearer %s" % token["access_token"]
+        }
+
+    def _refresh_rejected_token(self, rejected=None):
+        """Replace the access token after ``rejected``, the token sent with
+        the request, was refused. Defaults to the current token."""
+        with self._token_lock:
+            current = self._token["access_token"] if self._token else None
+            if rejected is None:
+                rejected = current
+            elif current is not None and current != rejected:
+                # another worker already replaced the rejected token
+                return
+            display.vvvv(
+                "consoledot: access token was rejected, requesting a new one"
             )
+            self._set_token(self._get_token(rejected=rejected))
+
+    def handle_httperror(self, exc):
+        if exc.code == 401 and self.get_option("offline_token"):
+            # The access token was revoked or expired ahead of expires_in, get
+            # a new one and have the connection replay the request.
+            self._refresh_rejected_token()
+            return True
+        return super(HttpApi, self).handle_httperror(exc)
+
+    def _ensure_connected(self):
+        # connection.send() is what establishes the connection and its URL,
+        # requests sent through the pool or the JSON-RPC never go through it.
+        # _connect() does nothing once connected.
+        self.connection._connect()
+
+    def _get_pool(self):
+        with self._pool_lock:
+            if self._pool is None:
+                self._ensure_connected()
+                self._pool = _ConnectionPool(
+                    self.connection._url,
+                    self.get_option("pool_size"),
+                    self.get_option("pool_idle_timeout"),
+                    self.connection.get_option("persistent_command_timeout"),
+                    validate_certs=self.connection.get_option("validate_certs"),
+                    use_proxy=self.connection.get_option("use_proxy"),
+                    ciphers=self._connection_ciphers(),
+                )
+            return self._pool
+
+    def _connection_ciphers(self):
+        try:
+            return self.connection.get_option("ciphers")
+        except KeyError:
+            # ansible.netcommon < 5.0.0 has no ciphers option
+            return None
 
-            self.connection._auth = {
-                "Authorization": "Bearer %s" % to_text(results["access_token"])
+    def _auth_headers(self):
+        if self.connection._auth:
+            return self.connection._auth
+        username = self.connection.get_option("remote_user")
+        if username:
+            credentials = "%s:%s" % (
+                username,
+                self.connection.get_option("password") or "",
+            )
+            return {
+                "Authorization": "Basic %s"
+                % to_text(base64.b64encode(to_bytes(credentials)))
             }
+        return {}
 
-    def send_request(self, request_method, path, data=None, headers=None):
+    def _send_pooled(self, request_method, path, data, headers):
+        body = to_bytes(data) if data is not None else None
+        for attempt in range(2):
+            request_headers = dict(headers)
+            request_headers.update(self._auth_headers())
+            self.connection._log_messages(
+                "send url '%s%s' with data '%s' and method '%s'"
+                % (self.connection._url, path, data, request_method)
+            )
+            try:
+                code, response_headers, response_data = self._get_pool().request(
+                    request_method, path, body=body, headers=request_headers
+                )
+            except (socket.error, http_client.HTTPException) as e:
+                raise AnsibleConnectionFailure(
+                    "Could not connect to %s%s: %s"
+                    % (self.connection._url, path, to_native(e))
+                )
+            # Same as handle_httperror for the non-pooled transport, replay
+            # once with a new token.
+            if code == 401 and attempt == 0 and self.get_option("offline_token"):
+                authorization = request_headers.get("Authorization", "")
+                if authorization.startswith("Bearer "):
+                    self._refresh_rejected_token(authorization[len("Bearer "):])
+                else:
+                    self._refresh_rejected_token()
+                continue
+            self.connection._log_messages("received response: '%s'" % to_text(response_data))
+            return code, response_headers, response_data
 
-        self._hack_the_auth()
+    def _send(self, request_method, path, data, headers):
+        if self.get_option("pool_size") > 0:
+            return self._send_pooled(request_method, path, data, headers)
 
         try:
-            headers = headers if headers else BASE_HEADERS
-            headers["User-Agent"] = "curl/7.82.0"
-            self._display_request(request_method)
-            if self.connection._auth:
-                headers.update(self.connection._auth)
+            # Only replay once after a 401, a second rejection of a freshly
+            # issued token will not be fixed by asking for yet another one.
             response, response_data = self.connection.send(
-                path, data, method=request_method, headers=headers
+                path, data, retries=1, method=request_method, headers=headers
             )
-            value = to_text(response_data.getvalue())
-
-            return response.getcode(), self._response_to_json(value)
+            response_headers = response.headers
+            response_data = response_data.getvalue()
         except HTTPError as e:
-            error = json.loads(e.read())
-            return e.code, error
+            response, response_headers, response_data = e, e.headers, e.read()
+        return (
+            response.getcode(),
+            response_headers,
+            _decompress(response_headers.get("Content-Encoding"), response_data),
+        )
+
+    def _account_key(self, *extra):
+        """Hash identifying the console.redhat.com host and account in use."""
+        return hashlib.sha256(
+            to_bytes(
+                ":".join(
+                    [
+                        self.connection._url,
+                        self.get_option("offline_token"),
+                        self.connection.get_option("remote_user") or "",
+                    ]
+                    + list(extra)
+                )
+            )
+        ).hexdigest()
+
+    def _throttle(self, path):
+        limits = self.get_option("rate_limits")
+        if not limits:
+            return
+        if self._rate_limiter is None:
+            state_dir = os.path.expanduser(self.get_option("rate_limit_state_dir"))
+            if not os.path.isdir(state_dir):
+                os.makedirs(state_dir, mode=0o700)
+            # One budget per console.redhat.com account and host
+            self._rate_limiter = _RateLimiter(
+                os.path.join(state_dir, "ratelimit-%s.json" % self._account_key()),
+                limits,
+                burst=self.get_option("rate_limit_burst"),
+            )
+
+        family = _rate_limit_family(path)
+        waited = self._rate_limiter.acquire(family)
+        if waited:
+            display.vvvv(
+                "consoledot: waited %.2fs for the %s rate limit" % (waited, family)
+            )
+
+    def _get_response_cache(self):
+        if self.get_option("http_cache_size") <= 0:
+            return None
+        with self._response_cache_lock:
+            if self._response_cache is None:
+                cache_dir = self.get_option("http_cache_dir")
+                self._response_cache = _ResponseCache(
+                    self.get_option("http_cache_size"),
+                    os.path.expanduser(cache_dir) if cache_dir else None,
+                )
+            return self._response_cache
+
+    def _retry_delay(self, attempt, response_headers):
+        retry_after = None
+        if response_headers is not None:
+            retry_after = _parse_retry_after(response_headers.get("Retry-After"))
+        if retry_after is not None:
+            # None when the server asks for a longer wait than allowed
+            if retry_after > self.get_option("retry_backoff_max"):
+                return None
+            return retry_after
+        delay = min(
+            self.get_option("retry_backoff_max"),
+            self.get_option("retry_backoff") * (2 ** attempt),
+        )
+        return random.uniform(0, delay)
+
+    def send_request(
+        self, request_method, path, data=None, headers=None, with_meta=False
+    ):
+        """Send a request to console.redhat.com and return its status code and
+        decoded JSON body.
+
+        With ``with_meta`` a third element is returned, a dict with the number
+        of ``retries`` the request needed and whether the response was served
+        from the HTTP cache after a ``304 Not Modified`` (``cached``).
+        """
+
+        # The cache and rate limit keys below are built from the connection
+        # URL, which is only known once connected
+        self._ensure_connected()
+
+        request_headers = dict(BASE_HEADERS)
+        request_headers.update(headers or {})
+        request_headers["User-Agent"] = "curl/7.82.0"
+        request_headers["Accept-Encoding"] = "gzip, deflate"
+        self._display_request(request_method)
+
+        response_cache = cache_key = cached = None
+        if request_method.upper() == "GET":
+            response_cache = self._get_response_cache()
+        if response_cache is not None:
+            cache_key = self._account_key(path)
+            cached = response_cache.get(cache_key)
+            if cached is not None:
+                if cached.get("etag"):
+                    request_headers["If-None-Match"] = cached["etag"]
+                if cached.get("last_modified"):
+                    request_headers["If-Modified-Since"] = cached["last_modified"]
+
+        idempotent = request_method.upper() in IDEMPOTENT_METHODS
+        retries = self.get_option("retries")
+        retry_status_codes = self.get_option("retry_status_codes")
+        attempt = 0
+        while True:
+            self._hack_the_auth()
+            self._throttle(path)
+            try:
+                code, response_headers, response_data = self._send(
+                    request_method, path, data, request_headers
+                )
+            except AnsibleConnectionFailure as e:
+                if not idempotent or attempt >= retries:
+                    raise
+                reason, response_headers = to_native(e), None
+            else:
+                retryable = code in retry_status_codes and (idempotent or code == 429)
+                if not retryable or attempt >= retries:
+                    break
+                reason = "HTTP %s" % code
+
+            delay = self._retry_delay(attempt, response_headers)
+            if delay is None:
+                display.vvv(
+                    "consoledot: %s %s failed (%s), Retry-After exceeds retry_backoff_max"
+                    % (request_method, path, reason)
+                )
+                break
+            attempt += 1
+            display.vvv(
+                "consoledot: %s %s failed (%s), retry %d/%d in %.1fs"
+                % (request_method, path, reason, attempt, retries, delay)
+            )
+            time.sleep(delay)
+
+        not_modified = code == 304 and cached is not None
+        if not_modified:
+            code, response_data = cached["code"], to_bytes(cached["body"])
+        elif response_cache is not None and code == 200:
+            etag = response_headers.get("ETag")
+            last_modified = response_headers.get("Last-Modified")
+            if etag or last_modified:
+                response_cache.put(
+                    cache_key,
+                    {
+                        "code": code,
+                        "etag": etag,
+                        "last_modified": last_modified,
+                        "body": to_text(response_data),
+                    },
+                )
+
+        response = self._response_to_json(response_data)
+        if with_meta:
+            return code, response, {"retries": attempt, "cached": not_modified}
+        return code, response
+
+    def send_requests(self, requests, max_workers=None):
+        """Send several requests concurrently and return their results in the
+        order of ``requests``.
+
+        Each request is a dict with ``method`` and ``path`` and optionally
+        ``data`` and ``headers``. Each result is a ``[code, response, meta]``
+        list as returned by ``send_request`` with ``with_meta``, plus the
+        ``elapsed`` seconds in ``meta``. A request that raised gets a ``None``
+        code and response and the error message in ``meta["error"]``.
+
+        Up to ``max_workers`` requests are sent at the same time, or
+        batch_workers when it is not given.
+        """
+        # connect once before the workers share the connection
+        self._ensure_connected()
+
+        workers = max_workers or self.get_option("batch_workers")
+
+        def send(request):
+            started = time.time()
+            try:
+                code, response, meta = self.send_request(
+                    request["method"],
+                    request["path"],
+                    data=request.get("data"),
+                    headers=request.get("headers"),
+                    with_meta=True,
+                )
+            except Exception as e:
+                code, response = None, None
+                meta = {"retries": 0, "cached": False, "error": to_text(e)}
+            meta["elapsed"] = time.time() - started
+            return [code, response, meta]
+
+        if workers <= 1 or len(requests) <= 1:
+            return [send(request) for request in requests]
+        with ThreadPoolExecutor(max_workers=min(workers, len(requests))) as executor:
+            return list(executor.map(send, requests))
 
     def _display_request(self, request_method):
         display.vvvvv("Web Services: %s %s" % (request_method, self.connection._url))
 
-    def _response_to_json(self, response_text):
+    def _response_to_json(self, response_data):
+        # Decoded straight from the response bytes, without an extra text copy
         try:
-            return json.loads(response_text) if response_text else {}
+            return json_loads(response_data) if response_data.strip() else {}
         # JSONDecodeError only available on Python 3.5+
         except ValueError:
-            raise ConnectionError("Invalid JSON response: %s" % response_text)
+            raise ConnectionError("Invalid JSON response: %s" % to_text(response_data))
 
     def update_auth(self, response, response_text):
         self._hack_the_auth()
@@ -10,6 +10,7 @@ DOCUMENTATION = """
         - Uses a YAML configuration file that ends with ``hostinventory.(yml|yaml)``.
     extends_documentation_fragment:
         - constructed
+        - inventory_cache
     options:
       plugin:
         description: the name of this plugin, it should always be set to 'consoledot.edgemanagement.edge' for this plugin to recognize it as it's own.
@@ -36,23 +37,125 @@ DOCUMENTATION = """
         description: prefix to apply to host variables
         default: rhedge
         type: str
+      max_concurrency:
+        description:
+          - Maximum number of requests sent to console.redhat.com at the same time
+            while fetching device pages and system profiles.
+          - Set to 1 to send requests one after another.
+        default: 4
+        type: int
+      page_size:
+        description:
+          - Number of devices requested per page from the Edge API.
+          - With I(adaptive_page_size) this is the size of the first page.
+        default: 100
+        type: int
+      adaptive_page_size:
+        description:
+          - Double the page size, up to 1000 devices, while pages are returned faster
+            than I(page_latency_target).
+          - Halve the page size and request the page again in two halves when the
+            request times out or fails with a server error, the page size then stays
+            below the size that failed.
+        default: false
+        type: bool
+      page_latency_target:
+        description:
+          - Time in seconds a page of devices should take at most to be returned when
+            I(adaptive_page_size) is enabled.
+        default: 2.0
+        type: float
+      shard_count:
+        description:
+          - Number of shards the devices are split into, to let several controllers
+            each build the inventory of a part of the fleet.
+        default: 1
+        type: int
+      shard_index:
+        description:
+          - Shard of the devices this inventory holds, from 0 to I(shard_count) - 1.
+        default: 0
+        type: int
+      shard_by:
+        description:
+          - How devices are assigned to shards.
+          - C(uuid) spreads the devices evenly using a hash of their C(DeviceUUID).
+          - C(group) keeps the devices of a device group on the same shard, using a
+            hash of the first of their group names in alphabetical order. Devices in no
+            group are assigned by C(DeviceUUID).
+        default: uuid
+        type: str
+        choices: ['uuid', 'group']
+      delta_sync:
+        description:
+          - Keep a snapshot of the inventory in the inventory cache and only fetch the
+            system profiles of devices that are new or were updated in the host
+            inventory since the previous sync. Devices that no longer exist are removed.
+          - The list of devices is still refreshed on every run, the cached inventory is
+            never used as is.
+          - Requires I(cache) to be enabled, otherwise every run is a full sync.
+        default: false
+        type: bool
 """
 
 EXAMPLES = """
 # basic example using environment vars for auth and no extra config
 plugin: maxamilion.edgemanagement.rhhinventory
+
+---
+# cache the inventory for an hour in a json file
+plugin: consoledot.edgemanagement.edge
+cache: true
+cache_plugin: ansible.builtin.jsonfile
+cache_timeout: 3600
+cache_connection: ~/.ansible/edge_inventory_cache
+
+---
+# refresh the inventory on every run, only fetching what changed since the last one
+plugin: consoledot.edgemanagement.edge
+cache: true
+cache_plugin: ansible.builtin.jsonfile
+cache_connection: ~/.ansible/edge_inventory_cache
+delta_sync: true
+
+---
+# build the inventory of the second of three controllers, by device group
+plugin: consoledot.edgemanagement.edge
+shard_count: 3
+shard_index: 1
+shard_by: group
 """
 
-from ansible.plugins.inventory import BaseInventoryPlugin, Constructable
+from ansible.plugins.inventory import BaseInventoryPlugin, Cacheable, Constructable
 from ansible.module_utils.six.moves.urllib.parse import urlencode, quote_plus
 from ansible.module_utils._text import to_bytes, to_native, to_text
 from ansible.module_utils.urls import Request
 from ansible.errors import AnsibleError
 import ansible.module_utils.six.moves.urllib.error as urllib_error
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+import hashlib
 import json
+import socket
+import threading
+import time
+
+# Number of hosts whose system profile is requested at once, the Inventory
+# API returns at most 100 results per page
+PROFILE_CHUNK_SIZE = 50
+
+INVENTORY_PAGE_SIZE = 100
+
+# Upper bound of the page size of the Edge API in adaptive mode
+MAX_PAGE_SIZE = 1000
+
+# Hosts updated this long before the previous sync are fetched again to make
+# up for clock differences between the controller and console.redhat.com
+DELTA_SYNC_OVERLAP = timedelta(minutes=5)
 
 
-class InventoryModule(BaseInventoryPlugin, Constructable):
+class InventoryModule(BaseInventoryPlugin, Constructable, Cacheable):
     """Host inventory parser for ansible using Red Hat Edge Manager as source."""
 
     NAME = "consoledot.edgemanagement.edge"
@@ -82,92 +185,347 @@ class InventoryModule(BaseInventoryPlugin, Constructable):
         super(InventoryModule, self).parse(inventory, loader, path)
         self._read_config_data(path)
 
-        self.server = self.get_option("server")
-        edge_device_view_url = "%s/api/edge/v1/devices/devicesview?" % (self.server)
-        inventory_hosts_url = "%s/api/inventory/v1/hosts/" % (self.server)
-        strict = self.get_option("strict")
+        if not 0 <= self.get_option("shard_index") < self.get_option("shard_count"):
+            raise AnsibleError(
+                "shard_index must be between 0 and shard_count - 1, got %d"
+                % self.get_option("shard_index")
+            )
+        if self.get_option("page_size") < 1:
+            raise AnsibleError(
+                "page_size must be greater than 0, got %d" % self.get_option("page_size")
+            )
+        if self.get_option("page_latency_target") <= 0:
+            raise AnsibleError(
+                "page_latency_target must be greater than 0, got %s"
+                % self.get_option("page_latency_target")
+            )
+
+        cache_key = self.get_cache_key(path)
+        # cache may be True or False at this point to indicate if the
+        # inventory is being refreshed, get the cache option for the plugin
+        # to determine if the cache is enabled
+        user_cache_setting = self.get_option("cache")
+        attempt_to_read_cache = user_cache_setting and cache
+        cache_needs_update = user_cache_setting and not cache
+
+        snapshot = None
+        if attempt_to_read_cache:
+            try:
+                snapshot = self._cache[cache_key]
+            except KeyError:
+                cache_needs_update = True
+            # caches written by older versions of this plugin hold a list
+            if not isinstance(snapshot, dict):
+                snapshot = None
+
+        if self.get_option("delta_sync") and user_cache_setting:
+            # the snapshot is only the starting point of the sync
+            devices = self._fetch_devices(snapshot)
+            cache_needs_update = True
+        elif snapshot is None:
+            devices = self._fetch_devices()
+            cache_needs_update = user_cache_setting
+        else:
+            devices = snapshot["devices"]
+
+        # devices are added to the inventory as they are fetched, only the
+        # snapshot written to the cache holds all of them at once
+        if cache_needs_update:
+            snapshot = {"synced_at": self._sync_time(), "devices": [], "missing": []}
+
         selection = self.get_option("selection")
         vars_prefix = self.get_option("vars_prefix")
-        username = self.get_option("user")
-        password = self.get_option("password")
+        for entry in devices:
+            if entry["addresses"] is None:
+                if cache_needs_update:
+                    snapshot["missing"].append(entry["device"]["DeviceUUID"])
+                continue
+            self._populate_device(entry, selection, vars_prefix)
+            if cache_needs_update:
+                snapshot["devices"].append(entry)
+
+        if cache_needs_update:
+            self._cache[cache_key] = snapshot
+
+    def _sync_time(self):
+        # hosts updated shortly before the sync are fetched again by the next
+        # one in delta mode
+        return (datetime.now(timezone.utc) - DELTA_SYNC_OVERLAP).strftime(
+            "%Y-%m-%dT%H:%M:%S.%fZ"
+        )
+
+    def _get_json(self, url):
+        # urllib Request objects are not safe to share between threads, each
+        # worker thread keeps its own
+        request = getattr(self._thread_local, "request", None)
+        if request is None:
+            request = self._thread_local.request = Request(
+                url_username=self.get_option("user"),
+                url_password=self.get_option("password"),
+                use_proxy=True,
+                headers=self.headers,
+                force_basic_auth=True,
+            )
+        return json.load(request.get(url))
+
+    def _imap(self, function, items):
+        """Lazily call function for every item on the worker pool, with at most
+        max_concurrency calls in flight, and yield the results in the order of
+        items."""
+        if self._executor is None:
+            for item in items:
+                yield function(item)
+            return
+
+        items = iter(items)
+        pending = deque()
+        for item in items:
+            pending.append(self._executor.submit(function, item))
+            if len(pending) >= self.get_option("max_concurrency"):
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+    def _fetch_devices(self, snapshot=None):
+        """Yield every Edge device as ``{"device": ..., "addresses": [...]}``
+        while it is fetched, ``addresses`` is None for devices missing from the
+        host inventory.
 
+        When the ``snapshot`` of a previous sync is given, only the system
+        profiles of devices that are new or were updated since then are
+        fetched.
+        """
+        self.server = self.get_option("server")
         self.headers = {"Accept": "application/json"}
-        self.request = Request(
-            url_username=username,
-            url_password=password,
-            use_proxy=True,
-            headers=self.headers,
-            force_basic_auth=True,
+        self._thread_local = threading.local()
+
+        max_concurrency = self.get_option("max_concurrency")
+        if max_concurrency > 1:
+            self._executor = ThreadPoolExecutor(max_workers=max_concurrency)
+        else:
+            self._executor = None
+        try:
+            for entry in self._fetch_devices_with_profiles(snapshot):
+                yield entry
+        finally:
+            if self._executor is not None:
+                self._executor.shutdown()
+
+    def _fetch_devices_with_profiles(self, snapshot):
+        edge_device_view_url = "%s/api/edge/v1/devices/devicesview?" % (self.server)
+        inventory_hosts_url = "%s/api/inventory/v1/hosts/" % (self.server)
+
+        # addresses of the devices whose profile did not change since the
+        # previous sync, devices that are gone are simply not carried over
+        known_addresses = {}
+        missing = set()
+        if snapshot is not None:
+            updated = self._fetch_updated_host_ids(
+                "%s/api/inventory/v1/hosts?" % (self.server), snapshot["synced_at"]
+            )
+            for entry in snapshot["devices"]:
+                if entry["device"]["DeviceUUID"] not in updated:
+                    known_addresses[entry["device"]["DeviceUUID"]] = entry["addresses"]
+            missing = set(snapshot["missing"]) - updated
+
+        def iter_blocks():
+            # group the devices in blocks holding at most PROFILE_CHUNK_SIZE
+            # devices whose profile has to be fetched
+            block, stale = [], []
+            for page in self._iter_device_pages(edge_device_view_url):
+                for host in page:
+                    if not self._in_shard(host):
+                        continue
+                    block.append(host)
+                    if (
+                        host["DeviceUUID"] not in known_addresses
+                        and host["DeviceUUID"] not in missing
+                    ):
+                        stale.append(host["DeviceUUID"])
+                    if len(stale) == PROFILE_CHUNK_SIZE:
+                        yield block, stale
+                        block, stale = [], []
+            if block:
+                yield block, stale
+
+        def fetch_block(block_and_stale):
+            block, stale = block_and_stale
+            if not stale:
+                return block, {}
+            return block, self._fetch_network_interfaces(inventory_hosts_url, stale)
+
+        for block, network_interfaces in self._imap(fetch_block, iter_blocks()):
+            for host in block:
+                uuid = host["DeviceUUID"]
+                if uuid in network_interfaces:
+                    addresses = self._ipv4_addresses(network_interfaces[uuid])
+                else:
+                    # devices missing from the host inventory have no profile
+                    addresses = known_addresses.get(uuid)
+                yield {"device": host, "addresses": addresses}
+
+    def _in_shard(self, host):
+        shard_count = self.get_option("shard_count")
+        if shard_count == 1:
+            return True
+
+        key = host["DeviceUUID"]
+        if self.get_option("shard_by") == "group" and host.get("DeviceGroups"):
+            key = sorted(group["Name"] for group in host["DeviceGroups"])[0]
+        # the built-in hash() of strings changes between processes
+        digest = hashlib.sha256(to_bytes(key)).hexdigest()
+        return int(digest, 16) % shard_count == self.get_option("shard_index")
+
+    def _iter_device_pages(self, edge_device_view_url):
+        """Yield the pages of devices of the Edge API, the first page tells how
+        many devices there are."""
+        self._page_size = self.get_option("page_size")
+        # pages are never grown back to a size the API could not handle
+        self._max_page_size = MAX_PAGE_SIZE
+        self._page_size_lock = threading.Lock()
+
+        first_page_size = self._page_size
+        count, devices = self._fetch_device_page(
+            edge_device_view_url, 0, first_page_size
         )
+        yield devices
 
-        first_page = json.load(self.request.get(edge_device_view_url + "limit=1"))
+        def page_ranges():
+            # the size of the next page is only decided when it is requested
+            offset = first_page_size
+            while offset < count:
+                with self._page_size_lock:
+                    page_size = self._page_size
+                yield offset, page_size
+                offset += page_size
 
-        pagination_step = 20
-        results = []
-        for offset in range(0, first_page["count"], pagination_step):
-            try:
-                response = json.load(
-                    self.request.get(
-                        edge_device_view_url
-                        + "limit=%d&offset=%d" % (pagination_step, offset)
-                    )
-                )
-                results += response["data"]["devices"]
-            except urllib_error.HTTPError as e:
-                raise AnsibleError("http error: %s" % to_native(e))
-            except IndexError as e:
-                raise AnsibleError(
-                    "Invalid Response from server(%s): %s"
-                    % (to_native(self.server), to_native(e))
-                )
+        for _count, devices in self._imap(
+            lambda page_range: self._fetch_device_page(
+                edge_device_view_url, *page_range
+            ),
+            page_ranges(),
+        ):
+            yield devices
 
-        for host in results:
+    def _fetch_device_page(self, edge_device_view_url, offset, limit):
+        """Return the total number of devices and the ``limit`` devices
+        starting at ``offset``."""
+        adaptive = self.get_option("adaptive_page_size")
+        started = time.time()
+        try:
+            response = self._get_json(
+                edge_device_view_url + "limit=%d&offset=%d" % (limit, offset)
+            )
+        except (urllib_error.URLError, socket.timeout) as e:
+            if not adaptive or limit == 1 or not self._is_overloaded(e):
+                if isinstance(e, urllib_error.HTTPError):
+                    raise AnsibleError("http error: %s" % to_native(e))
+                raise
 
-            try:
+            half = limit // 2
+            with self._page_size_lock:
+                self._page_size = min(self._page_size, half)
+                self._max_page_size = min(self._max_page_size, half)
+            self.display.vvv(
+                "Edge API overloaded by %d devices per page, retrying with %d: %s"
+                % (limit, half, to_native(e))
+            )
+            count, devices = self._fetch_device_page(edge_device_view_url, offset, half)
+            count, others = self._fetch_device_page(
+                edge_device_view_url, offset + half, limit - half
+            )
+            return count, devices + others
 
-                device_inventory_check = json.load(
-                    self.request.get(inventory_hosts_url + host["DeviceUUID"])
-                )
-                if (
-                    "count" in device_inventory_check
-                    and device_inventory_check["count"] == 0
-                ):
-                    continue
-
-                sysprofile = json.load(
-                    self.request.get(
-                        inventory_hosts_url + "%s/system_profile" % host["DeviceUUID"]
-                    )
-                )
-                for interface in sysprofile["results"][0]["system_profile"][
-                    "network_interfaces"
-                ]:
-                    if "ipv4_addresses" in interface:
-                        if "127.0.0.1" not in interface["ipv4_addresses"]:
-                            for ipaddr in interface["ipv4_addresses"]:
-                                host_name = self.inventory.add_host(ipaddr)
-                                for item in host.keys():
-                                    self.inventory.set_variable(
-                                        host_name, vars_prefix + item, host[item]
-                                    )
-                                    if item == selection:
-                                        self.inventory.set_variable(
-                                            host_name, "ansible_host", host[item]
-                                        )
-
-                                if "DeviceGroups" in host and host["DeviceGroups"]:
-                                    for group in host["DeviceGroups"]:
-                                        self.inventory.add_group(
-                                            self._sanitize_group_name(group["Name"])
-                                        )
-                                        self.inventory.add_host(
-                                            host_name,
-                                            group=self._sanitize_group_name(
-                                                group["Name"]
-                                            ),
-                                        )
+        if adaptive and time.time() - started < self.get_option("page_latency_target"):
+            with self._page_size_lock:
+                if limit >= self._page_size:
+                    self._page_size = min(limit * 2, self._max_page_size)
 
+        try:
+            return response["count"], response["data"]["devices"]
+        except (KeyError, IndexError) as e:
+            raise AnsibleError(
+                "Invalid Response from server(%s): %s"
+                % (to_native(self.server), to_native(e))
+            )
+
+    def _is_overloaded(self, error):
+        if isinstance(error, urllib_error.HTTPError):
+            return error.code >= 500
+        return isinstance(getattr(error, "reason", error), socket.timeout)
+
+    def _fetch_updated_host_ids(self, inventory_hosts_url, updated_start):
+        """Return the ids of the hosts of the host inventory updated since
+        ``updated_start``."""
+        url = inventory_hosts_url + "updated_start=%s&per_page=%d" % (
+            quote_plus(updated_start),
+            INVENTORY_PAGE_SIZE,
+        )
+
+        def fetch_page(page):
+            try:
+                return self._get_json(url + "&page=%d" % page)
             except urllib_error.HTTPError as e:
                 raise AnsibleError(
                     "Host Inventory Service HTTP Error: %s" % to_native(e)
                 )
+
+        first_page = fetch_page(1)
+        pages = [first_page] + list(
+            self._imap(
+                fetch_page,
+                range(2, -(-first_page["total"] // INVENTORY_PAGE_SIZE) + 1),
+            )
+        )
+        return set(host["id"] for page in pages for host in page["results"])
+
+    def _fetch_network_interfaces(self, inventory_hosts_url, uuids):
+        """Return the network interfaces of the hosts of ``uuids`` that are in
+        the host inventory, keyed by host id, in a single request."""
+        url = (
+            inventory_hosts_url
+            + "%s/system_profile?fields[system_profile]=network_interfaces&per_page=%d"
+            % (",".join(uuids), len(uuids))
+        )
+        try:
+            response = self._get_json(url)
+        except urllib_error.HTTPError as e:
+            if e.code == 404:
+                # none of the hosts are in the host inventory
+                return {}
+            raise AnsibleError("Host Inventory Service HTTP Error: %s" % to_native(e))
+
+        return dict(
+            (result["id"], result["system_profile"].get("network_interfaces", []))
+            for result in response["results"]
+        )
+
+    def _ipv4_addresses(self, network_interfaces):
+        addresses = []
+        for interface in network_interfaces:
+            if "ipv4_addresses" in interface:
+                if "127.0.0.1" not in interface["ipv4_addresses"]:
+                    addresses.extend(interface["ipv4_addresses"])
+        return addresses
+
+    def _populate_device(self, entry, selection, vars_prefix):
+        host = entry["device"]
+
+        # the variables are the same for every address of the device, build
+        # them once and share the values between its hosts
+        host_vars = dict((vars_prefix + item, value) for item, value in host.items())
+        if selection in host:
+            host_vars["ansible_host"] = host[selection]
+        groups = [
+            self._sanitize_group_name(group["Name"])
+            for group in host.get("DeviceGroups") or []
+        ]
+        for group in groups:
+            self.inventory.add_group(group)
+
+        for ipaddr in entry["addresses"]:
+            host_name = self.inventory.add_host(ipaddr)
+            for name, value in host_vars.items():
+                self.inventory.set_variable(host_name, name, value)
+            for group in groups:
+                self.inventory.add_host(host_name, group=group)
@@ -8,6 +8,11 @@ from __future__ import absolute_import, division, print_function
 __metaclass__ = type
 from ansible.module_utils.connection import Connection
 import ansible.module_utils.six.moves.urllib as url_lib
+from ansible.module_utils.six.moves.urllib.parse import parse_qsl, urlencode
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+import copy
+import threading
 
 INVENTORY_API_HOSTS = '/api/inventory/v1/hosts'
 
@@ -21,32 +26,200 @@ EDGE_API_THIRDPARTYREPO = '/api/edge/v1/thirdpartyrepo'
 EDGE_API_UPDATES = "/api/edge/v1/updates"
 EDGE_API_IMAGEBUILDER_PACKAGES = '/api/image-builder/v1/packages'
 
+# The Inventory API does not accept more than 100 hosts per page
+DEFAULT_PAGE_SIZE = 100
+DEFAULT_PREFETCH = 4
+# Every call to the persistent connection must finish within its
+# persistent_command_timeout (30s by default), so a batch is sent in chunks of
+# BATCH_ROUNDS requests per worker: a call then lasts about BATCH_ROUNDS
+# sequential requests, whatever the size of the batch. DEFAULT_BATCH_WORKERS
+# matches the default batch_workers option of the httpapi plugin.
+DEFAULT_BATCH_WORKERS = 4
+BATCH_ROUNDS = 4
+
+
+def _resource_root(path):
+    """Return the API collection a path belongs to, e.g. /api/edge/v1/device-groups
+    for /api/edge/v1/device-groups/12/devices?limit=10"""
+    return '/'.join(path.split('?', 1)[0].split('/')[:5])
+
+
+class ConsoleDotBatch(object):
+    """Requests queued inside a ``with crc_request.batch() as batch:`` block.
+
+    Each call returns the position of its request, ``results`` and
+    ``responses`` are filled in the same order once the block is left.
+    """
+
+    def __init__(self):
+        self.requests = []
+        self.results = []
+
+    @property
+    def responses(self):
+        return [result['response'] for result in self.results]
+
+    def _queue(self, method, path, data=None):
+        self.requests.append({'method': method, 'path': path, 'data': data})
+        return len(self.requests) - 1
+
+    def get(self, path):
+        return self._queue("GET", path)
+
+    def put(self, path, data=None):
+        return self._queue("PUT", path, data)
+
+    def post(self, path, data=None):
+        return self._queue("POST", path, data)
+
+    def patch(self, path, data=None):
+        return self._queue("PATCH", path, data)
+
+    def delete(self, path, data=None):
+        return self._queue("DELETE", path, data)
+
 
 class ConsoleDotRequest(object):
-    def __init__(self, module, headers=None):
+    def __init__(self, module, headers=None, cache=False):
 
         self.module = module
         self.connection = Connection(self.module._socket_path)
+        # returned by modules as request_stats
+        self.stats = {'requests': 0, 'retries': 0, 'cache_hits': 0, 'cache_misses': 0}
+        self._stats_lock = threading.Lock()
+        # GET responses memoized for the lifetime of this object, entries of
+        # a collection are dropped as soon as the module modifies it
+        self.cache = cache
+        self._cache = {}
+        # devicesview records walked by get_edge_systems, and the rest of the
+        # walk to resume on the next call
+        self._edge_systems = {}
+        self._edge_walk = None
+        self._edge_walk_left = 0
+        self._edge_walk_page_size = DEFAULT_PAGE_SIZE
 
-    def _httpapi_error_handle(self, method, path, custom_error_msg='', data=None):
-        # FIXME - make use of handle_httperror(self, exception) where applicable
-        #   https://docs.ansible.com/ansible/latest/network/dev_guide/developing_plugins_network.html#developing-plugins-httpapi
+    def _httpapi_error_handle(self, method, path, custom_error_msg='', data=None, fail_on_status=False):
+        # Retries of throttled and failed requests happen in the httpapi
+        # plugin, see the retries option of consoledot.edgemanagement.consoledot
 
         try:
-            code, response = self.connection.send_request(method, path, data=data)
+            code, response, meta = self.connection.send_request(
+                method, path, data=data, with_meta=True
+            )
+            with self._stats_lock:
+                self.stats['requests'] += 1
+                self.stats['retries'] += meta['retries']
+            if fail_on_status:
+                self._check_status(method, path, code, response)
             return response
         except Exception as e:
             if custom_error_msg == '':
-                self.module.fail_json(msg=f"[{method}] - {e}")
+                self.module.fail_json(msg=f"[{method}] - {e}", request_stats=self.stats)
             else:
-                self.module.fail_json(msg=custom_error_msg)
+                self.module.fail_json(msg=custom_error_msg, request_stats=self.stats)
+
+    def _check_status(self, method, path, code, response):
+        """Fail the module when a request the results depend on, such as a
+        page of a listing, was answered with an error status."""
+        if code is not None and code >= 400:
+            self.module.fail_json(msg=f"[{method}] {path} - HTTP {code}: {response}", request_stats=self.stats)
+
+    @staticmethod
+    def _page_path(path, offset, page_size):
+        separator = '&' if '?' in path else '?'
+        if path.startswith(INVENTORY_API_HOSTS):
+            # Inventory API pages are numbered from 1 instead of using offsets
+            return f'{path}{separator}per_page={page_size}&page={offset // page_size + 1}'
+        return f'{path}{separator}limit={page_size}&offset={offset}'
+
+    @staticmethod
+    def _page_records(response):
+        if isinstance(response, list):
+            return response
+        records = response.get('results', response.get('data'))
+        if isinstance(records, dict):
+            # devicesview nests the devices one level deeper
+            records = records.get('devices')
+        return records or []
+
+    @staticmethod
+    def _page_total(response):
+        if isinstance(response, list):
+            # a bare list only holds the current page
+            return None
+        # Inventory API responses use count for the size of the current page
+        if 'total' in response:
+            return response['total']
+        return response.get('count')
+
+    def iter_pages(self, path, page_size=DEFAULT_PAGE_SIZE, prefetch=DEFAULT_PREFETCH):
+        """Yield every record of a paged listing endpoint.
+
+        The first page tells how many records there are, the following pages
+        are then requested up to ``prefetch`` at a time while the records of
+        earlier pages are consumed.
+        """
+        first_page = self.get(self._page_path(path, 0, page_size), fail_on_status=True)
+        records = self._page_records(first_page)
+        for record in records:
+            yield record
+
+        for record in self._iter_remaining_pages(
+            path, first_page, page_size, prefetch
+        ):
+            yield record
+
+    def _iter_remaining_pages(self, path, first_page, page_size, prefetch):
+        records = self._page_records(first_page)
+        total = self._page_total(first_page)
+        if total is None:
+            # No record count to plan with, walk the pages until a short one
+            offset = page_size
+            while len(records) == page_size:
+                records = self._page_records(
+                    self.get(self._page_path(path, offset, page_size), fail_on_status=True)
+                )
+                for record in records:
+                    yield record
+                offset += page_size
+            return
+
+        offsets = list(range(page_size, total, page_size))
+        waves = [offsets[index:index + prefetch] for index in range(0, len(offsets), max(prefetch, 1))]
+        if not waves:
+            return
+
+        def fetch(wave):
+            with self.batch() as batch:
+                for offset in wave:
+                    batch.get(self._page_path(path, offset, page_size))
+            for request, result in zip(batch.requests, batch.results):
+                self._check_status(request['method'], request['path'], result['code'], result['response'])
+            return batch.responses
+
+        # Each wave of pages is fetched in a single batch, the next wave is
+        # already on its way while the records of the current one are consumed
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            future = executor.submit(fetch, waves[0])
+            for next_wave in waves[1:] + [None]:
+                pages = future.result()
+                if next_wave is not None:
+                    future = executor.submit(fetch, next_wave)
+                for page in pages:
+                    for record in self._page_records(page):
+                        yield record
+
+    def get_all(self, path, **kwargs):
+        """Return the records of every page of a listing endpoint as a list."""
+        return list(self.iter_pages(path, **kwargs))
 
     def get_groups(self, name: str = ''):
         valid_url_name = url_lib.parse.quote(name)
-        return self.get(f'{EDGE_API_GROUPS}?name={valid_url_name}')
+        groups = self.get_all(f'{EDGE_API_GROUPS}?name={valid_url_name}')
+        return {'count': len(groups), 'data': groups}
 
     def find_group(self, group_data, name: str = ''):
-        if group_data['data'] is None:
+        if not group_data['data']:
             return []
         return [
             group for group in group_data['data'] if group['DeviceGroup']['Name'] == name
@@ -57,17 +230,170 @@ class ConsoleDotRequest(object):
         response = self.get(api_request)
         return response['data']['devices'][0]
 
+    def get_edge_systems(self, uuids, page_size=DEFAULT_PAGE_SIZE, prefetch=DEFAULT_PREFETCH):
+        """Return the devicesview records of ``uuids`` keyed by UUID.
+
+        Devices are either looked up one at a time or found by walking
+        devicesview, whichever takes fewer requests. UUIDs that do not belong
+        to an Edge device are left out.
+
+        The walk is shared by the calls made on this object: the devices it
+        went through are kept and the next call resumes it, so that looking
+        up a large fleet chunk by chunk walks devicesview at most once.
+        """
+        wanted = set(uuids)
+        if self._edge_walk is None:
+            if len(wanted) <= 1:
+                return self._lookup_edge_systems(wanted, prefetch)
+
+            first_page = self.get(self._page_path(EDGE_API_DEVICESVIEW, 0, page_size), fail_on_status=True)
+            records = self._page_records(first_page)
+            for device in records:
+                self._edge_systems[device['DeviceUUID']] = device
+            self._edge_walk_left = max((self._page_total(first_page) or 0) - len(records), 0)
+            self._edge_walk_page_size = page_size
+            self._edge_walk = self._iter_remaining_pages(EDGE_API_DEVICESVIEW, first_page, page_size, prefetch)
+
+        edge_systems = dict(
+            (uuid, self._edge_systems[uuid]) for uuid in wanted if uuid in self._edge_systems
+        )
+        remaining = wanted.difference(edge_systems)
+        remaining_pages = -(-self._edge_walk_left // self._edge_walk_page_size)
+        if len(remaining) <= remaining_pages:
+            edge_systems.update(self._lookup_edge_systems(remaining, prefetch))
+            return edge_systems
+
+        for device in self._edge_walk:
+            self._edge_walk_left -= 1
+            self._edge_systems[device['DeviceUUID']] = device
+            if device['DeviceUUID'] in remaining:
+                edge_systems[device['DeviceUUID']] = device
+                remaining.discard(device['DeviceUUID'])
+                if not remaining:
+                    break
+        else:
+            self._edge_walk_left = 0
+        return edge_systems
+
+    def _lookup_edge_systems(self, uuids, prefetch=DEFAULT_PREFETCH):
+        with self.batch(max_workers=prefetch) as batch:
+            for uuid in uuids:
+                batch.get('%s?uuid=%s' % (EDGE_API_DEVICESVIEW, uuid))
+        for request, result in zip(batch.requests, batch.results):
+            self._check_status(request['method'], request['path'], result['code'], result['response'])
+
+        edge_systems = {}
+        for response in batch.responses:
+            for device in self._page_records(response):
+                edge_systems[device['DeviceUUID']] = device
+        return edge_systems
+
+    @staticmethod
+    def _cache_key(path):
+        resource, separator, query = path.partition('?')
+        return (resource.rstrip('/'), urlencode(sorted(parse_qsl(query, keep_blank_values=True))))
+
+    def _invalidate(self, path):
+        root = _resource_root(path)
+        with self._stats_lock:
+            for key in [key for key in self._cache if key[0].startswith(root)]:
+                del self._cache[key]
+
+    def _cache_lookup(self, path):
+        key = self._cache_key(path)
+        with self._stats_lock:
+            if key in self._cache:
+                self.stats['cache_hits'] += 1
+                return copy.deepcopy(self._cache[key])
+            self.stats['cache_misses'] += 1
+        return None
+
+    def _cache_store(self, path, response):
+        with self._stats_lock:
+            self._cache[self._cache_key(path)] = copy.deepcopy(response)
+
     def get(self, path, **kwargs):
-        return self._httpapi_error_handle("GET", path, **kwargs)
+        if not self.cache:
+            return self._httpapi_error_handle("GET", path, **kwargs)
+
+        response = self._cache_lookup(path)
+        if response is None:
+            response = self._httpapi_error_handle("GET", path, **kwargs)
+            self._cache_store(path, response)
+        return response
 
     def put(self, path, **kwargs):
+        self._invalidate(path)
         return self._httpapi_error_handle("PUT", path, **kwargs)
 
     def post(self, path, **kwargs):
+        self._invalidate(path)
         return self._httpapi_error_handle("POST", path, **kwargs)
 
     def patch(self, path, **kwargs):
+        self._invalidate(path)
         return self._httpapi_error_handle("PATCH", path, **kwargs)
 
     def delete(self, path, **kwargs):
+        self._invalidate(path)
         return self._httpapi_error_handle("DELETE", path, **kwargs)
+
+    @contextmanager
+    def batch(self, max_workers=None, fail_on_error=True):
+        """Collect the requests made on the yielded ConsoleDotBatch and send
+        them when the block ends, in as few calls to the persistent connection
+        as possible. The connection process runs the requests of a call
+        concurrently, up to ``max_workers`` or its batch_workers option, and
+        each call carries BATCH_ROUNDS requests per worker so that it stays
+        within persistent_command_timeout.
+
+        With ``fail_on_error`` the module fails on the first request that
+        raised, otherwise the message is left in the ``error`` of its result.
+        """
+        batch = ConsoleDotBatch()
+        yield batch
+        batch.results = self._send_batch(batch.requests, max_workers, fail_on_error)
+
+    def _send_batch(self, requests, max_workers=None, fail_on_error=True):
+        results = [None] * len(requests)
+        pending = []
+        for index, request in enumerate(requests):
+            if request['method'] != 'GET':
+                self._invalidate(request['path'])
+            elif self.cache:
+                response = self._cache_lookup(request['path'])
+                if response is not None:
+                    results[index] = {
+                        'code': 200, 'response': response, 'error': None, 'retries': 0, 'elapsed': 0,
+                    }
+                    continue
+            pending.append(index)
+
+        chunk_size = (max_workers or DEFAULT_BATCH_WORKERS) * BATCH_ROUNDS
+        for start in range(0, len(pending), chunk_size):
+            chunk = pending[start:start + chunk_size]
+            try:
+                replies = self.connection.send_requests(
+                    [requests[index] for index in chunk], max_workers=max_workers
+                )
+            except Exception as e:
+                self.module.fail_json(msg=f"[BATCH] - {e}", request_stats=self.stats)
+
+            for index, (code, response, meta) in zip(chunk, replies):
+                method, path = requests[index]['method'], requests[index]['path']
+                with self._stats_lock:
+                    self.stats['requests'] += 1
+                    self.stats['retries'] += meta['retries']
+                if meta.get('error'):
+                    if fail_on_error:
+                        self.module.fail_json(msg=f"[{method}] - {meta['error']}", request_stats=self.stats)
+                elif method == 'GET' and self.cache:
+                    self._cache_store(path, response)
+                results[index] = {
+                    'code': code,
+                    'response': response,
+                    'error': meta.get('error'),
+                    'retries': meta['retries'],
+                    'elapsed': meta['elapsed'],
+                }
+        return results
@@ -106,21 +106,21 @@ def main():
     crc_request = ConsoleDotRequest(module)
 
     try:
-        group_data = crc_request.get('%s?name=%s' % (EDGE_API_GROUPS, module.params["name"]))
+        group_data = crc_request.get_groups(module.params["name"])
         group_match = find_group(module.params['name'], group_data)
 
         if len(module.params['devices']) == 0:
-            module.fail_json(msg="No devices passed", changed=False)
+            module.fail_json(msg="No devices passed", changed=False, request_stats=crc_request.stats)
 
         if len(group_match) == 0:
-            module.fail_json(msg="Group does not exist", changed=False)
+            module.fail_json(msg="Group does not exist", changed=False, request_stats=crc_request.stats)
 
-        group_id = group_data["data"][0]["DeviceGroup"]["ID"]
+        group_id = group_match[0]["DeviceGroup"]["ID"]
         device_group_data = format_group_data(group_id, module.params['devices'])
 
         if module.params["state"] == "present":
 
-            group_devices = group_data['data'][0]['DeviceGroup']['Devices']
+            group_devices = group_match[0]['DeviceGroup']['Devices']
             if len(group_devices) > 0:
                 group_device_ids = []
                 for device in group_devices:
@@ -136,6 +136,7 @@ def main():
                         msg='Nothing changed',
                         changed=False,
                         postdata=device_group_data,
+                        request_stats=crc_request.stats,
                     )
 
                 device_group_data = format_group_data(group_id, new_device_ids)
@@ -147,6 +148,7 @@ def main():
                 msg='Added devices to %s successfully' % module.params['name'],
                 changed=True,
                 postdata=device_group_data,
+                request_stats=crc_request.stats,
             )
 
         if module.params["state"] == "absent":
@@ -158,10 +160,11 @@ def main():
                 msg='Removed devices to %s successfully' % module.params['name'],
                 changed=True,
                 postdata=device_group_data,
+                request_stats=crc_request.stats,
             )
 
     except Exception as e:
-        module.fail_json(msg=to_text(e), postdata=device_group_data)
+        module.fail_json(msg=to_text(e), postdata=device_group_data, request_stats=crc_request.stats)
 
 
 if __name__ == "__main__":
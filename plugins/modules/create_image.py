@@ -131,7 +131,7 @@ def main():
 
     module = AnsibleModule(argument_spec=argspec, supports_check_mode=True)
 
-    crc_request = ConsoleDotRequest(module)
+    crc_request = ConsoleDotRequest(module, cache=True)
 
     # {
     #  "name": "jhdskfjsdkfjdsjfjdsfkjk",
@@ -185,7 +185,7 @@ def main():
     }
 
     def find_custom_repo(repo_name):
-        return crc_request.get(f"{EDGE_API_THIRDPARTYREPO}?name={quote(repo_name)}")
+        return crc_request.get_all(f"{EDGE_API_THIRDPARTYREPO}?name={quote(repo_name)}")
 
     with_installer = module.params["installer"]
     if with_installer:
@@ -198,18 +198,19 @@ def main():
             }
         )
     for customRepository in module.params["custom_repositories"]:
-        response = find_custom_repo(customRepository)
-        if response["count"] > 0:
+        repos = find_custom_repo(customRepository)
+        if repos:
             postdata["thirdPartyRepositories"].append(
                 {
-                    "name": response["data"][0]["Name"],
-                    "url": response["data"][0]["URL"],
-                    "id": response["data"][0]["ID"],
+                    "name": repos[0]["Name"],
+                    "url": repos[0]["URL"],
+                    "id": repos[0]["ID"],
                 }
             )
         else:
             module.fail_json(
-                msg=f'Custom repository {customRepository["name"]} was not found'
+                msg=f'Custom repository {customRepository} was not found',
+                request_stats=crc_request.stats,
             )
 
     for customPackage in module.params["custom_packages"]:
@@ -223,13 +224,16 @@ def main():
         response = crc_request.post(EDGE_API_IMAGES, data=json.dumps(postdata))
         if response["Status"] not in [400, 403, 404]:
             module.exit_json(
-                msg="Successfully queued image build", image=response, postdata=postdata
+                msg="Successfully queued image build",
+                image=response,
+                postdata=postdata,
+                request_stats=crc_request.stats,
             )
         else:
-            module.fail_json(msg=response, postdata=postdata)
+            module.fail_json(msg=response, postdata=postdata, request_stats=crc_request.stats)
 
     except Exception as e:
-        module.fail_json(msg=to_text(e), postdata=postdata)
+        module.fail_json(msg=to_text(e), postdata=postdata, request_stats=crc_request.stats)
 
 
 if __name__ == "__main__":
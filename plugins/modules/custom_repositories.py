@@ -66,7 +66,7 @@ def main():
 
     module = AnsibleModule(argument_spec=argspec, supports_check_mode=True)
 
-    crc_request = ConsoleDotRequest(module)
+    crc_request = ConsoleDotRequest(module, cache=True)
 
     create_repo_data = {"name": module.params["name"], "url": module.params["base_url"]}
 
@@ -87,7 +87,8 @@ def main():
         ]
 
     def get_repos():
-        return crc_request.get(f'{EDGE_API_THIRDPARTYREPO}?name={module.params["name"]}')
+        repos = crc_request.get_all(f'{EDGE_API_THIRDPARTYREPO}?name={quote(module.params["name"])}')
+        return {"count": len(repos), "data": repos}
 
     def post_repo():
         return crc_request.post(f"{EDGE_API_THIRDPARTYREPO}", data=json.dumps(create_repo_data))
@@ -99,17 +100,20 @@ def main():
     try:
         if module.params["state"] == "present":
             if module.params["base_url"] is None:
-                module.fail_json(msg="Base url is required when state equals present")
+                module.fail_json(msg="Base url is required when state equals present", request_stats=crc_request.stats)
 
             if not is_valid_base_url(module.params["base_url"]):
-                module.fail_json(msg="Base url is not a valid url")
+                module.fail_json(msg="Base url is not a valid url", request_stats=crc_request.stats)
 
             repo_data = get_repos()
             repo_match = find_repo(repo_data)
 
             if len(repo_match) == 1:
                 module.exit_json(
-                    msg="Nothing changed", changed=False, postdata=create_repo_data
+                    msg="Nothing changed",
+                    changed=False,
+                    postdata=create_repo_data,
+                    request_stats=crc_request.stats,
                 )
 
             response = post_repo()
@@ -119,13 +123,16 @@ def main():
             repo_match = find_repo(repo_data)
             if len(repo_match) == 0:
                 module.fail_json(
-                    msg="Failure to create custom repository", postdata=repo_data
+                    msg="Failure to create custom repository",
+                    postdata=repo_data,
+                    request_stats=crc_request.stats,
                 )
             else:
                 module.exit_json(
                     msg="Custom repository created successfully",
                     changed=True,
                     postdata=create_repo_data,
+                    request_stats=crc_request.stats,
                 )
 
         if module.params["state"] == "absent":
@@ -134,7 +141,10 @@ def main():
             repo_match = find_repo(repo_data)
             if len(repo_match) == 0:
                 module.exit_json(
-                    msg="Nothing changed", changed=False, postdata=repo_data
+                    msg="Nothing changed",
+                    changed=False,
+                    postdata=repo_data,
+                    request_stats=crc_request.stats,
                 )
 
             response = remove_repo(repo_match)
@@ -147,12 +157,13 @@ def main():
                     msg="Custom repository removed successfully",
                     changed=True,
                     postdata=repo_data,
+                    request_stats=crc_request.stats,
                 )
             else:
-                module.fail_json(msg=response, postdata=create_repo_data)
+                module.fail_json(msg=response, postdata=create_repo_data, request_stats=crc_request.stats)
 
     except Exception as e:
-        module.fail_json(msg=to_text(e), postdata=create_repo_data)
+        module.fail_json(msg=to_text(e), postdata=create_repo_data, request_stats=crc_request.stats)
 
 
 if __name__ == "__main__":
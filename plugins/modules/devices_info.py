@@ -88,18 +88,19 @@ def main():
                 )
 
             if query_strs:
-                devices = crc_request.get(
+                devices = crc_request.get_all(
                     f"{EDGE_API_DEVICES}?{'&'.join(query_strs)}"
                 )
             else:
-                devices = crc_request.get(EDGE_API_DEVICES)
+                devices = crc_request.get_all(EDGE_API_DEVICES)
+            devices = {"count": len(devices), "data": devices}
 
         if ("Status" in devices) and (devices["Status"] in [400, 403, 404]):
-            module.fail_json(msg=devices)
+            module.fail_json(msg=devices, request_stats=crc_request.stats)
     except Exception as e:
-        module.fail_json(msg=to_text(e))
+        module.fail_json(msg=to_text(e), request_stats=crc_request.stats)
 
-    module.exit_json(devices=devices, changed=False)
+    module.exit_json(devices=devices, changed=False, request_stats=crc_request.stats)
 
 
 if __name__ == "__main__":
@@ -42,9 +42,13 @@ options:
     type: str
   ipv4:
     description:
-      - The ipv4 address to filter by
+      - The ipv4 addresses to filter by, systems with any address matching any of the patterns are kept
+      - Each pattern is either a CIDR network such as C(10.0.0.0/16) or four octets, each of them
+        a number, a C([min:max]) range or C([]) for any value, such as C(192.168.[0:3].[])
+      - Empty patterns are ignored
     required: false
-    type: str
+    type: list
+    elements: str
   os_release:
     description:
       - The os release to filter by
@@ -87,8 +91,50 @@ options:
     required: false
     type: list
     elements: str
+  page_size:
+    description:
+      - Number of systems requested per page from the Inventory API, at most 100.
+      - Several pages are requested at the same time.
+    required: false
+    type: int
+    default: 100
+  limit:
+    description:
+      - Stop requesting systems once this many matched, instead of going through every page.
+      - When C(host_type) is C(edge), systems without Edge device data are left out afterwards
+        and fewer systems may be returned.
+    required: false
+    type: int
+  return_fields:
+    description:
+      - Only return these fields of the matched systems, such as C(id), C(display_name) or C(edge_image_set_id).
+      - The C(id) of the systems is always returned.
+    required: false
+    type: list
+    elements: str
+  compact:
+    description:
+      - Only return the C(id) and the Edge related data of the matched systems, which is all
+        C(consoledot.edgemanagement.update_systems) needs.
+    required: false
+    type: bool
+    default: false
+  output_file:
+    description:
+      - Write the matched systems to this file on the controller, one JSON document per line,
+        instead of returning them in C(matched_systems).
+      - Only the path of the file and the number of systems are returned, not C(matched_systems) nor
+        C(edge_device_ids), the file can be handed to C(consoledot.edgemanagement.update_systems)
+        with its C(systems_file) option.
+      - Systems are written while they are fetched, so they are never all held in memory.
+      - The file is only replaced, and the task reported as changed, when its content differs. In check
+        mode the file is left untouched.
+    required: false
+    type: path
 
 notes:
+    - All filters but C(ipv4) are applied by the Inventory API, only the systems it returns are checked
+      against the C(ipv4) patterns and, when C(host_type) is C(edge), enriched with Edge data
     - Edge related data (edge_device_id, edge_image_id, edge_update_available)  is injected in system info if host type is edge
 author:
   - Chris Santiago (@resoluteCoder)
@@ -116,6 +162,31 @@ EXAMPLES = """
       register: filtered_systems
 
     - debug: var=filtered_systems['matched_systems']
+
+    - name: Find any 10 edge systems in a subnet
+      consoledot.edgemanagement.filter_systems:
+        host_type: 'edge'
+        ipv4:
+          - '10.0.0.0/22'
+          - '192.168.122.[22:199]'
+        limit: 10
+      register: sample_systems
+
+    - name: Filter edge systems keeping only what update_systems needs
+      consoledot.edgemanagement.filter_systems:
+        host_type: 'edge'
+        os_release: '8.5'
+        compact: true
+      register: filtered_systems
+
+    - name: Write a large number of matched systems to a file
+      consoledot.edgemanagement.filter_systems:
+        host_type: 'edge'
+        compact: true
+        output_file: /tmp/edge_systems.jsonl
+      register: filtered_systems
+
+    - debug: var=filtered_systems['count']
 """
 
 RETURN = """
@@ -130,59 +201,266 @@ from ansible_collections.consoledot.edgemanagement.plugins.module_utils.edgemana
     EDGE_API_DEVICESVIEW
 )
 
+from bisect import bisect_right
+from itertools import islice, product
+import hashlib
+import ipaddress
+import json
+import os
+import socket
+import struct
+import tempfile
+
+# Number of matched systems enriched with Edge data at once when they are
+# written to output_file
+OUTPUT_CHUNK_SIZE = 1000
+
+# Octet patterns matching more address ranges than this are checked octet by
+# octet instead of being expanded into address ranges
+MAX_IPV4_RANGES = 4096
+
 
 def parse_ip_pattern(section):
     if section == '[]':
         return (0, 255)
 
     if ':' not in section:
-        return (int(section), int(section))
+        min = max = int(section)
+    else:
+        min, max = section.replace('[', '').replace(']', '').split(':')
+        min, max = int(min), int(max)
+    if not 0 <= min <= max <= 255:
+        raise ValueError('invalid octet %s' % section)
+    return (min, max)
 
-    min, max = section.replace('[', '').replace(']', '').split(':')
-    return (int(min), int(max))
 
+def octets_to_ranges(octets):
+    """Return the address ranges matched by the octet ranges of a pattern as
+    (first, last) integers, or None when there are more than MAX_IPV4_RANGES."""
+    # the octets matching any value at the end of the pattern only widen the
+    # ranges of the octets before them
+    wildcards = 0
+    while wildcards < 4 and octets[3 - wildcards] == (0, 255):
+        wildcards += 1
+    if wildcards == 4:
+        return [(0, 2 ** 32 - 1)]
 
-def get_queries(facts):
-    top_level_filters = ['display_name',
-                         'fqdn', 'hostname_or_id', 'insights_id']
-    queries = []
-    for fact in facts:
-        fact_key, fact_value = fact
+    last = 3 - wildcards
+    count = 1
+    for min, max in octets[:last]:
+        count *= max - min + 1
+    if count > MAX_IPV4_RANGES:
+        return None
+
+    shift = 8 * wildcards
+    ranges = []
+    for prefix in product(*(range(min, max + 1) for min, max in octets[:last])):
+        base = 0
+        for octet in prefix:
+            base = base << 8 | octet
+        ranges.append((
+            (base << 8 | octets[last][0]) << shift,
+            ((base << 8 | octets[last][1]) + 1 << shift) - 1,
+        ))
+    return ranges
 
-        excluded_params = ['host_type', 'ipv4']
-        if fact_key in excluded_params or fact_value is None:
+
+def compile_ipv4_patterns(patterns):
+    """Compile the ipv4 patterns into sorted, merged address ranges plus the
+    octet ranges of the patterns too wide to be expanded."""
+    ranges = []
+    octet_patterns = []
+    for pattern in patterns:
+        pattern = pattern.strip()
+        if not pattern:
             continue
+        try:
+            if '/' in pattern:
+                network = ipaddress.IPv4Network(pattern, strict=False)
+                ranges.append((int(network.network_address), int(network.broadcast_address)))
+                continue
+
+            sections = pattern.split('.')
+            if len(sections) != 4:
+                raise ValueError('expected 4 octets')
+            octets = [parse_ip_pattern(section) for section in sections]
+        except ValueError as e:
+            raise ValueError('Invalid ipv4 pattern %s: %s' % (pattern, e))
+
+        pattern_ranges = octets_to_ranges(octets)
+        if pattern_ranges is None:
+            octet_patterns.append(octets)
+        else:
+            ranges.extend(pattern_ranges)
 
-        filter_string = ''
-        if fact_key in top_level_filters:
-            filter_string = '%s=%s' % (
-                fact_key, fact_value)
-            queries.append(filter_string)
-        elif isinstance(fact_value, list):
-            for value in fact_value:
-                filter_string = 'filter[system_profile][%s][]=%s' % (
-                    fact_key, value)
-                queries.append(filter_string)
+    starts, ends = [], []
+    for first, last in sorted(ranges):
+        if ends and first <= ends[-1] + 1:
+            ends[-1] = max(ends[-1], last)
         else:
-            filter_string = 'filter[system_profile][%s][]=%s' % (
-                fact_key, fact_value)
-            queries.append(filter_string)
-    return queries
+            starts.append(first)
+            ends.append(last)
+    return starts, ends, octet_patterns
 
 
-def get_matched_systems_by_ipv4(systems, ipv4_sections):
-    matched_systems = []
+def ipv4_matches(ip, compiled):
+    starts, ends, octet_patterns = compiled
+    try:
+        address = struct.unpack('!I', socket.inet_aton(ip))[0]
+    except (OSError, socket.error):
+        return False
+
+    index = bisect_right(starts, address) - 1
+    if index >= 0 and address <= ends[index]:
+        return True
+
+    for octets in octet_patterns:
+        if all(min <= (address >> 8 * (3 - position)) & 0xff <= max
+               for position, (min, max) in enumerate(octets)):
+            return True
+    return False
+
+
+# Facts the Inventory API filters on, from the most to the least selective.
+# The identifiers match a single host while hardware facts are shared by most
+# of a fleet.
+TOP_LEVEL_FILTERS = ['insights_id', 'hostname_or_id', 'fqdn', 'display_name']
+SYSTEM_PROFILE_FILTERS = [
+    'installed_services', 'enabled_services', 'os_kernel_version', 'os_release',
+    'number_of_cpus', 'number_of_sockets', 'cores_per_socket', 'infrastructure_vendor',
+]
+
+
+# Edge related data injected in the systems and the devicesview field it comes from
+EDGE_FIELDS = {
+    'edge_device_id': 'DeviceID',
+    'edge_image_name': 'ImageName',
+    'edge_image_id': 'ImageID',
+    'edge_image_set_id': 'ImageSetID',
+    'edge_update_available': 'UpdateAvailable',
+    'edge_system_status': 'Status',
+    'edge_update_status': 'DispatcherStatus',
+    'edge_update_status_reason': 'DispatcherReason',
+}
+
+
+def plan_query(params, ipv4_patterns=None):
+    """Split the filters between the query sent to the Inventory API and the
+    predicates the returned systems are checked against, in the order they
+    are applied."""
+    queries = []
+    for fact in TOP_LEVEL_FILTERS:
+        if params[fact] is not None:
+            queries.append('%s=%s' % (fact, quote(to_text(params[fact]), safe='')))
+
+    for fact in SYSTEM_PROFILE_FILTERS:
+        values = params[fact]
+        if values is None:
+            continue
+        if not isinstance(values, list):
+            values = [values]
+        for value in values:
+            queries.append('filter[system_profile][%s][]=%s' % (fact, quote(to_text(value), safe='')))
+
+    if params['host_type'] == 'edge':
+        queries.append('filter[system_profile][host_type]=edge')
+
+    # the API has no filter on addresses
+    predicates = []
+    if ipv4_patterns is not None:
+        predicates.append(lambda system: matches_ipv4(system, ipv4_patterns))
+    return queries, predicates
+
+
+def matches_ipv4(system, compiled):
+    for ip in system['ip_addresses']:
+        if ':' not in ip and ip != '127.0.0.1' and ipv4_matches(ip, compiled):
+            return True
+    return False
+
+
+def project_system(system, fields):
+    return dict((field, system[field]) for field in fields if field in system)
+
+
+def enrich_edge_systems(crc_request, systems, fields=None):
+    """Add the Edge related data to the systems and return those that belong
+    to an Edge device along with the device ids."""
+    edge_systems = crc_request.get_edge_systems([system['id'] for system in systems])
+    # systems without an Edge device cannot be enriched nor updated
+    systems = [system for system in systems if system['id'] in edge_systems]
+
+    edge_device_ids = []
     for system in systems:
-        for ip in system['ip_addresses']:
-            if ':' not in ip and ip != '127.0.0.1':
-                for index, section in enumerate(ipv4_sections):
-                    min, max = parse_ip_pattern(section)
-                    ip_section = int(ip.split('.')[index])
-                    if ip_section < min or ip_section > max:
-                        break
-                    if index == 3:  # last element in list
-                        matched_systems.append(system)
-    return matched_systems
+        edge_system_data = edge_systems[system['id']]
+
+        edge_device_ids.append(edge_system_data['DeviceID'])
+
+        for field, edge_field in EDGE_FIELDS.items():
+            if fields is None or field in fields:
+                system[field] = edge_system_data[edge_field]
+    return systems, edge_device_ids
+
+
+def file_sha1(path):
+    if not os.path.exists(path):
+        return None
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(65536), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def write_systems_file(path, chunks, check_mode=False):
+    """Write the systems of every chunk to path as JSON lines, replacing the
+    file once they are all written when its content changed. Return how many
+    systems there are and whether the file changed, in check mode the file is
+    left untouched."""
+    count = 0
+    digest = hashlib.sha1()
+    f = tmp_path = None
+    if not check_mode:
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)))
+        f = os.fdopen(fd, 'w')
+    try:
+        for chunk in chunks:
+            for system in chunk:
+                line = json.dumps(system) + '\n'
+                digest.update(line.encode('utf-8'))
+                if f is not None:
+                    f.write(line)
+            count += len(chunk)
+        changed = digest.hexdigest() != file_sha1(path)
+        if f is not None:
+            f.close()
+            if changed:
+                os.replace(tmp_path, path)
+            else:
+                os.unlink(tmp_path)
+    except Exception:
+        if f is not None:
+            f.close()
+            os.unlink(tmp_path)
+        raise
+    return count, changed
+
+
+def iter_chunks(iterable, size):
+    iterator = iter(iterable)
+    chunk = list(islice(iterator, size))
+    while chunk:
+        yield chunk
+        chunk = list(islice(iterator, size))
+
+
+def unique_systems(systems):
+    # pages may overlap when hosts are added while they are fetched
+    seen = set()
+    for system in systems:
+        if system['id'] not in seen:
+            seen.add(system['id'])
+            yield system
 
 
 def main():
@@ -190,7 +468,7 @@ def main():
         host_type=dict(required=False, type="str"),
         display_name=dict(required=False, type="str"),
         fqdn=dict(required=False, type="str"),
-        ipv4=dict(required=False, type="str"),
+        ipv4=dict(required=False, type="list", elements='str'),
         hostname_or_id=dict(required=False, type="str"),
         insights_id=dict(required=False, type="str"),
         os_release=dict(required=False, type="str"),
@@ -201,48 +479,85 @@ def main():
         number_of_sockets=dict(required=False, type="int"),
         enabled_services=dict(required=False, type="list", elements='str'),
         installed_services=dict(required=False, type="list", elements='str'),
+        page_size=dict(required=False, type="int", default=100),
+        limit=dict(required=False, type="int"),
+        return_fields=dict(required=False, type="list", elements='str'),
+        compact=dict(required=False, type="bool", default=False),
+        output_file=dict(required=False, type="path"),
     )
 
     module = AnsibleModule(
         argument_spec=argspec, supports_check_mode=True,
-        mutually_exclusive=[['display_name', 'fqdn', 'hostname_or_id', 'insights_id']])
+        mutually_exclusive=[['display_name', 'fqdn', 'hostname_or_id', 'insights_id'],
+                            ['return_fields', 'compact']])
 
     crc_request = ConsoleDotRequest(module)
 
+    if not 1 <= module.params['page_size'] <= 100:
+        module.fail_json(msg='page_size must be between 1 and 100', request_stats=crc_request.stats)
+    if module.params['limit'] is not None and module.params['limit'] < 1:
+        module.fail_json(msg='limit must be greater than 0', request_stats=crc_request.stats)
+
+    # empty patterns, such as an ipv4 variable set to '', disable the filter
+    ipv4 = [pattern for pattern in module.params['ipv4'] or [] if pattern.strip()]
+    ipv4_patterns = None
+    if ipv4:
+        try:
+            ipv4_patterns = compile_ipv4_patterns(ipv4)
+        except ValueError as e:
+            module.fail_json(msg=to_text(e), request_stats=crc_request.stats)
+
     try:
-        queries = get_queries(module.params.items())
-        api_request = '%s?%s' % (
-            INVENTORY_API_HOSTS, '&'.join(queries))
-        response = crc_request.get(api_request)
+        queries, predicates = plan_query(module.params, ipv4_patterns)
+        api_request = INVENTORY_API_HOSTS
+        if queries:
+            api_request = '%s?%s' % (INVENTORY_API_HOSTS, '&'.join(queries))
+        page_size = module.params['page_size']
+        if module.params['limit'] and not predicates:
+            # every system of the pages matches, do not fetch more than needed
+            page_size = min(page_size, module.params['limit'])
 
-        if module.params['ipv4']:
-            matched_systems = get_matched_systems_by_ipv4(response['results'], module.params['ipv4'].split('.'))
-        else:
-            matched_systems = response['results']
+        # pages are only requested while matches are still needed
+        systems = unique_systems(crc_request.iter_pages(api_request, page_size=page_size))
+        for predicate in predicates:
+            systems = filter(predicate, systems)
 
-        if module.params['host_type'] == 'edge':
-            edge_device_ids = []
-            for system in matched_systems:
-                edge_system_data = crc_request.get_edge_system(system['id'])
+        # drop the unwanted fields as systems come in rather than once all of
+        # them are held
+        fields = None
+        if module.params['compact']:
+            fields = ['id'] + list(EDGE_FIELDS)
+        elif module.params['return_fields'] is not None:
+            fields = ['id'] + module.params['return_fields']
+        if fields is not None:
+            systems = (project_system(system, fields) for system in systems)
+        systems = islice(systems, module.params['limit'])
 
-                edge_device_ids.append(edge_system_data['DeviceID'])
+        if module.params['output_file']:
+            # the edge device ids are in the file with their systems
+            chunks = iter_chunks(systems, OUTPUT_CHUNK_SIZE)
+            if module.params['host_type'] == 'edge':
+                chunks = (enrich_edge_systems(crc_request, chunk, fields)[0] for chunk in chunks)
 
-                system['edge_device_id'] = edge_system_data['DeviceID']
-                system['edge_image_name'] = edge_system_data['ImageName']
-                system['edge_image_id'] = edge_system_data['ImageID']
-                system['edge_image_set_id'] = edge_system_data['ImageSetID']
-                system['edge_update_available'] = edge_system_data['UpdateAvailable']
-                system['edge_system_status'] = edge_system_data['Status']
-                system['edge_update_status'] = edge_system_data['DispatcherStatus']
-                system['edge_update_status_reason'] = edge_system_data['DispatcherReason']
+            count, changed = write_systems_file(module.params['output_file'], chunks, module.check_mode)
+            module.exit_json(
+                msg='ran', changed=changed, systems_file=module.params['output_file'], count=count,
+                request_stats=crc_request.stats)
 
+        matched_systems = list(systems)
+        if module.params['host_type'] == 'edge':
+            matched_systems, edge_device_ids = enrich_edge_systems(crc_request, matched_systems, fields)
             module.exit_json(
-                msg='ran', changed=False, matched_systems=matched_systems, edge_device_ids=edge_device_ids)
+                msg='ran', changed=False, matched_systems=matched_systems, edge_device_ids=edge_device_ids,
+                request_stats=crc_request.stats)
         else:
             module.exit_json(
-                msg='ran', changed=False, matched_systems=matched_systems, edge_device_ids=[])
+                msg='ran', changed=False, matched_systems=matched_systems, edge_device_ids=[],
+                request_stats=crc_request.stats)
     except Exception as e:
-        module.fail_json(msg=to_text(e), changed=False, matched_systems=[], edge_device_ids=[])
+        module.fail_json(
+            msg=to_text(e), changed=False, matched_systems=[], edge_device_ids=[],
+            request_stats=crc_request.stats)
 
 
 if __name__ == "__main__":
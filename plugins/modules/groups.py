@@ -73,7 +73,6 @@ from ansible.module_utils.six.moves.urllib.parse import quote
 import re
 import fnmatch
 import json
-import ansible.module_utils.six.moves.urllib as url_lib
 
 
 def main():
@@ -85,20 +84,19 @@ def main():
 
     module = AnsibleModule(argument_spec=argspec, supports_check_mode=True)
 
-    crc_request = ConsoleDotRequest(module)
+    crc_request = ConsoleDotRequest(module, cache=True)
 
     create_group_data = {"name": module.params["name"], "type": "static"}
 
     def find_group(group_data, name: str = module.params['name']):
-        if group_data['data'] is None:
+        if not group_data['data']:
             return []
         return [
             group for group in group_data['data'] if group['DeviceGroup']['Name'] == name
         ]
 
     def get_groups(name: str = module.params['name']):
-        valid_url_name = url_lib.parse.quote(name)
-        return crc_request.get(f'{EDGE_API_GROUPS}?name={valid_url_name}')
+        return crc_request.get_groups(name)
 
     def post_group(name):
         group_data = {
@@ -143,7 +141,7 @@ def main():
                     has_been_changed = True
                     message = 'Groups created successfully'
 
-        module.exit_json(msg=message, changed=has_been_changed)
+        module.exit_json(msg=message, changed=has_been_changed, request_stats=crc_request.stats)
 
     def remove_multiple_groups(first_word, group_names):
         has_been_changed = False
@@ -160,7 +158,7 @@ def main():
                     has_been_changed = True
                     message = 'Groups removed successfully'
 
-        module.exit_json(msg=message, changed=has_been_changed)
+        module.exit_json(msg=message, changed=has_been_changed, request_stats=crc_request.stats)
 
     try:
         if module.params['state'] == 'present':
@@ -182,7 +180,10 @@ def main():
 
             if len(group_match) == 1:
                 module.exit_json(
-                    msg="Nothing changed", changed=False, postdata=create_group_data
+                    msg="Nothing changed",
+                    changed=False,
+                    postdata=create_group_data,
+                    request_stats=crc_request.stats,
                 )
 
             post_group(module.params['name'])
@@ -190,7 +191,8 @@ def main():
             module.exit_json(
                 msg='Group created successfully',
                 changed=True,
-                postdata=create_group_data
+                postdata=create_group_data,
+                request_stats=crc_request.stats,
             )
 
         if module.params['state'] == 'absent':
@@ -216,17 +218,18 @@ def main():
                 # limit the results to iterate
                 group_data = get_groups(first_word)
 
-                if group_data['data'] is None:
-                    module.exit_json(msg='Nothing changed', changed=False)
-
+                has_been_changed = False
+                message = 'Nothing changed'
                 for group in group_data['data']:
                     name = group['DeviceGroup']['Name']
                     found_match = fnmatch.fnmatch(name, module.params['name'])
                     if found_match:
                         remove_group(group)
+                        if (not has_been_changed):
+                            has_been_changed = True
+                            message = 'Removed groups successfully'
 
-                module.exit_json(
-                    msg='Removed groups successfully', changed=True)
+                module.exit_json(msg=message, changed=has_been_changed, request_stats=crc_request.stats)
 
             # remove single group
             group_data = get_groups()
@@ -234,7 +237,10 @@ def main():
             group_match = find_group(group_data)
             if len(group_match) == 0:
                 module.exit_json(
-                    msg="Nothing changed", changed=False, postdata=group_data
+                    msg="Nothing changed",
+                    changed=False,
+                    postdata=group_data,
+                    request_stats=crc_request.stats,
                 )
 
             response = remove_group(group_match[0])
@@ -244,13 +250,16 @@ def main():
 
             if len(group_match) == 0:
                 module.exit_json(
-                    msg="Group removed successfully", changed=True, postdata=group_data
+                    msg="Group removed successfully",
+                    changed=True,
+                    postdata=group_data,
+                    request_stats=crc_request.stats,
                 )
             else:
-                module.fail_json(msg=response, postdata=create_group_data)
+                module.fail_json(msg=response, postdata=create_group_data, request_stats=crc_request.stats)
 
     except Exception as e:
-        module.fail_json(msg=to_text(e), postdata=create_group_data)
+        module.fail_json(msg=to_text(e), postdata=create_group_data, request_stats=crc_request.stats)
 
 
 if __name__ == "__main__":
@@ -86,13 +86,14 @@ def main():
             )
 
         if query_strs:
-            images = crc_request.get(
+            images = crc_request.get_all(
                 f'{EDGE_API_IMAGES}?{"&".join(query_strs)}'
             )
         else:
-            images = crc_request.get(EDGE_API_IMAGES)
+            images = crc_request.get_all(EDGE_API_IMAGES)
+        images = {"count": len(images), "data": images}
 
-    module.exit_json(images=images, changed=False)
+    module.exit_json(images=images, changed=False, request_stats=crc_request.stats)
 
 
 if __name__ == "__main__":
@@ -86,13 +86,14 @@ def main():
             query_strs.append(f'name={quote(to_text(module.params["name"]))}')
 
         if query_strs:
-            imagesets = crc_request.get(
+            imagesets = crc_request.get_all(
                 f'{EDGE_API_IMAGESETS}?{"&".join(query_strs)}'
             )
         else:
-            imagesets = crc_request.get(EDGE_API_IMAGESETS)
+            imagesets = crc_request.get_all(EDGE_API_IMAGESETS)
+        imagesets = {"count": len(imagesets), "data": imagesets}
 
-    module.exit_json(imagesets=imagesets, changed=False)
+    module.exit_json(imagesets=imagesets, changed=False, request_stats=crc_request.stats)
 
 
 if __name__ == "__main__":
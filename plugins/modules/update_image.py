@@ -115,11 +115,11 @@ def main():
     try:
         response = crc_request.get(EDGE_API_IMAGESETS_VIEW + '?name=%s' % module.params['name'])
         if response['count'] == 0:
-            module.fail_json(msg='%s not found' % module.params['name'])
+            module.fail_json(msg='%s not found' % module.params['name'], request_stats=crc_request.stats)
         if response['count'] > 1:
-            module.fail_json(msg='found more than one image, image name must be unique')
+            module.fail_json(msg='found more than one image, image name must be unique', request_stats=crc_request.stats)
         if response['data'][0]['Status'] == 'BUILDING':
-            module.exit_json(msg='Image has been queued for updating.')
+            module.exit_json(msg='Image has been queued for updating.', request_stats=crc_request.stats)
         if response['data'][0]['Status'] in ['SUCCESS', 'ERROR']:
             current_image = crc_request.get(EDGE_API_IMAGES + '/%s/details' % response['data'][0]['ImageID'])
 
@@ -168,10 +168,10 @@ def main():
                 EDGE_API_IMAGES + '/%s/update' % current_image['image']['ID'],
                 data=json.dumps(postdata),
             )
-            module.exit_json(msg='Successfully queued image build', image=response, postdata=postdata)
+            module.exit_json(msg='Successfully queued image build', image=response, postdata=postdata, request_stats=crc_request.stats)
 
     except Exception as e:
-        module.fail_json(msg=to_text(e), postdata=postdata)
+        module.fail_json(msg=to_text(e), postdata=postdata, request_stats=crc_request.stats)
 
 
 if __name__ == '__main__':
@@ -23,6 +23,13 @@ options:
     required: false
     type: list
     elements: dict
+  systems_file:
+    description:
+      - File written by the C(consoledot.edgemanagement.filter_systems) module with its C(output_file) option
+        holding the systems to be updated.
+      - The systems are read one at a time from the file instead of being passed as a variable.
+    required: false
+    type: path
   uuids:
     description:
       - System UUIDs to be updated
@@ -40,9 +47,19 @@ options:
       - Image version the system(s) will be set to.
     required: false
     type: int
+  max_parallel:
+    description:
+      - Maximum number of updates, one per image set, dispatched at the same time.
+      - It replaces the C(batch_workers) option of the httpapi connection for these updates,
+        requests beyond its C(pool_size) wait for a pooled connection to be free.
+    required: false
+    type: int
+    default: 4
 author:
   - Chris Santiago (@resoluteCoder)
 notes:
+  - Every image set gets its own update, the result of each of them is returned in C(batches) and a failed
+    update does not stop the others. The module fails once all updates were dispatched if any of them failed.
   - systems will only work if the input is supplied by the C(consoledote.edgemanagement.filter_systems) module
 """
 
@@ -86,6 +103,23 @@ EXAMPLES = """
         systems: '{{ filtered_systems["matched_systems"] }}'
         version: 7
       register: output
+
+- name: Update a large number of filtered systems
+  hosts: CRC
+  gather_facts: false
+  tasks:
+    - name: Filter systems by insight facts
+      consoledot.edgemanagement.filter_systems:
+        host_type: 'edge'
+        os_release: '8.5'
+        compact: true
+        output_file: /tmp/edge_systems.jsonl
+      register: filtered_systems
+
+    - name: Update systems to latest version
+      consoledot.edgemanagement.update_systems:
+        systems_file: '{{ filtered_systems["systems_file"] }}'
+      register: output
 """
 
 from ansible.module_utils.basic import AnsibleModule
@@ -116,109 +150,175 @@ def batch_edge_systems(systems: list, isUUIDS=True) -> dict:
     return image_set_ids
 
 
+def get_update_ids(response):
+    # one update transaction is created per device of the batch
+    if isinstance(response, dict):
+        response = [response]
+    return [update['ID'] for update in response or [] if isinstance(update, dict) and 'ID' in update]
+
+
+def summarize_batches(batch_results):
+    failed = [result for result in batch_results if result['error']]
+    return {
+        'batches': len(batch_results),
+        'succeeded': len(batch_results) - len(failed),
+        'failed': len(failed),
+        'devices': sum(len(result['devices']) for result in batch_results),
+        'failed_devices': sum(len(result['devices']) for result in failed),
+    }
+
+
+def read_systems_file(path):
+    with open(path) as systems_file:
+        for line in systems_file:
+            if line.strip():
+                yield json.loads(line)
+
+
 def main():
 
     argspec = dict(
         systems=dict(required=False, type="list", elements="dict"),
+        systems_file=dict(required=False, type="path"),
         uuids=dict(required=False, type="list", elements="str"),
         groups=dict(required=False, type="list", elements="str"),
         version=dict(required=False, type="int"),
+        max_parallel=dict(required=False, type="int", default=4),
     )
 
     module = AnsibleModule(
         argument_spec=argspec,
+        mutually_exclusive=[['systems', 'systems_file']],
     )
 
     crc_request = ConsoleDotRequest(module)
 
+    if module.params['max_parallel'] < 1:
+        module.fail_json(msg='max_parallel must be greater than 0', request_stats=crc_request.stats)
+
+    batch_results = []
+
     def update_systems(systems, commit_id=0):
-        for image_set_id, system_uuids in systems.items():
-            system_post_data = {
-                'CommitID': commit_id,
-                'DevicesUUID': system_uuids
-            }
-            try:
-                crc_request.post(
-                    EDGE_API_UPDATES, data=json.dumps(system_post_data)
-                )
-            except Exception as e:
-                module.fail_json(msg=e)
-
-    dispatched_updated = False
+        with crc_request.batch(max_workers=module.params['max_parallel'], fail_on_error=False) as batch:
+            for image_set_id, system_uuids in systems.items():
+                system_post_data = {
+                    'CommitID': commit_id,
+                    'DevicesUUID': system_uuids
+                }
+                batch.post(EDGE_API_UPDATES, data=json.dumps(system_post_data))
+
+        for (image_set_id, system_uuids), result in zip(systems.items(), batch.results):
+            error = result['error']
+            if error is None and result['code'] >= 400:
+                error = 'HTTP %s: %s' % (result['code'], result['response'])
+            batch_results.append({
+                'image_set_id': image_set_id,
+                'devices': system_uuids,
+                'update_ids': [] if error else get_update_ids(result['response']),
+                'elapsed': round(result['elapsed'], 3),
+                'error': error,
+            })
 
     try:
         # used with filter systems module
-        if module.params['systems']:
-            if module.params['version']:
-                imageset_id = module.params['systems'][0]['edge_image_set_id']
-                for system in module.params['systems']:
-                    if system['edge_image_set_id'] != imageset_id:
-                        module.exit_json(msg='systems have multiple image sets, \
-                                         systems need to have the same image set')
-
-                # FIXME - properly handle pagination
+        if module.params['systems_file']:
+            systems = read_systems_file(module.params['systems_file'])
+        else:
+            systems = module.params['systems'] or []
+
+        if module.params['version']:
+            imageset_ids = set()
+            system_ids = []
+            for system in systems:
+                imageset_ids.add(system['edge_image_set_id'])
+                system_ids.append(system['id'])
+
+            if len(imageset_ids) > 1:
+                module.exit_json(msg='systems have multiple image sets, \
+                                 systems need to have the same image set',
+                                 request_stats=crc_request.stats)
+
+            if system_ids:
+                imageset_id = imageset_ids.pop()
                 edge_api_image_set_versions = EDGE_API_IMAGESETS + '/view/%s/versions' % imageset_id
-                response = crc_request.get(edge_api_image_set_versions)
-                if module.params['version'] > response['count']:
-                    module.exit_json(msg='version provided not found')
-
                 version_image_id = 0
 
-                for version in response['data']:
+                for version in crc_request.iter_pages(edge_api_image_set_versions):
                     if version['Version'] == module.params['version']:
                         version_image_id = version['ID']
+                        break
+                else:
+                    module.exit_json(msg='version provided not found', request_stats=crc_request.stats)
 
                 edge_api_image_set = EDGE_API_IMAGESETS + '/view/%s/versions/%s' \
                     % (imageset_id, version_image_id)
                 response = crc_request.get(edge_api_image_set)
                 image_commit_id = response['ImageDetails']['image']['CommitID']
 
-                systems = []
-                for system in module.params['systems']:
-                    systems.append(system['id'])
-
-                update_systems({imageset_id: systems}, image_commit_id)
-                dispatched_updated = True
-            else:
-                systems_with_updates = []
-                for system in module.params['systems']:
-                    if system['edge_update_available'] and system['edge_system_status'] == 'RUNNING':
-                        systems_with_updates.append(system)
-
+                update_systems({imageset_id: system_ids}, image_commit_id)
+        else:
+            systems_with_updates = [
+                system for system in systems
+                if system['edge_update_available'] and system['edge_system_status'] == 'RUNNING'
+            ]
+            if systems_with_updates:
                 batched_systems = batch_edge_systems(systems_with_updates, isUUIDS=False)
                 update_systems(batched_systems)
-                dispatched_updated = True
 
         if module.params['uuids']:
-            systems_with_updates = []
-            for uuid in module.params['uuids']:
-                edge_system_data = crc_request.get_edge_system(uuid)
+            edge_systems = crc_request.get_edge_systems(module.params['uuids'])
+            missing_uuids = [uuid for uuid in module.params['uuids'] if uuid not in edge_systems]
+            if missing_uuids:
+                module.fail_json(msg='%s cannot be found' % ', '.join(missing_uuids), request_stats=crc_request.stats)
 
+            systems_with_updates = []
+            for edge_system_data in edge_systems.values():
                 if edge_system_data['UpdateAvailable'] and edge_system_data['Status'] == 'RUNNING':
                     systems_with_updates.append(edge_system_data)
 
             batched_systems = batch_edge_systems(systems_with_updates)
             update_systems(batched_systems)
-            dispatched_updated = True
 
         if module.params['groups']:
+            # devices may belong to several of the groups, each is updated once
+            group_uuids = []
+            seen_uuids = set()
             for group_name in module.params['groups']:
                 response = crc_request.get_groups(group_name)
                 group_data = crc_request.find_group(response, group_name)
 
                 if len(group_data) == 0:
-                    module.fail_json(msg='%s cannot be found' % group_name)
+                    module.fail_json(msg='%s cannot be found' % group_name, request_stats=crc_request.stats)
+
+                for system in group_data[0]['DeviceGroup']['Devices'] or []:
+                    if system['UpdateAvailable'] and system['UUID'] not in seen_uuids:
+                        seen_uuids.add(system['UUID'])
+                        group_uuids.append(system['UUID'])
+
+            # group devices do not tell their image set, devicesview does
+            edge_systems = crc_request.get_edge_systems(group_uuids)
+            missing_uuids = [uuid for uuid in group_uuids if uuid not in edge_systems]
+            if missing_uuids:
+                module.warn('%s cannot be found, not updating them' % ', '.join(missing_uuids))
+
+            systems_with_updates = [edge_systems[uuid] for uuid in group_uuids if uuid in edge_systems]
+            if systems_with_updates:
+                batched_systems = batch_edge_systems(systems_with_updates)
+                update_systems(batched_systems)
 
-                edge_systems = group_data[0]['DeviceGroup']['Devices']
-                for system in edge_systems:
-                    if system['UpdateAvailable']:
-                        # key is dummy image set id to match function param
-                        update_systems({0: [system['UUID']]})
+        summary = summarize_batches(batch_results)
+        if summary['failed']:
+            module.fail_json(
+                msg='%d of %d updates failed' % (summary['failed'], summary['batches']),
+                changed=summary['succeeded'] > 0, batches=batch_results, summary=summary,
+                request_stats=crc_request.stats)
 
-        module.exit_json(msg='ran succesfully', changed=dispatched_updated)
+        module.exit_json(
+            msg='ran succesfully', changed=summary['succeeded'] > 0, batches=batch_results, summary=summary,
+            request_stats=crc_request.stats)
 
     except Exception as e:
-        module.fail_json(msg=to_text(e))
+        module.fail_json(msg=to_text(e), request_stats=crc_request.stats)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,290 @@
+# -*- coding: utf-8 -*-
+
+# MIT License (see LICENSE or https://opensource.org/licenses/MIT)
+
+from __future__ import absolute_import, division, print_function
+__metaclass__ = type
+
+import json
+import threading
+import time
+
+import pytest
+
+from ansible.errors import AnsibleConnectionFailure
+from ansible_collections.consoledot.edgemanagement.plugins.httpapi import consoledot
+from ansible_collections.consoledot.edgemanagement.plugins.httpapi.consoledot import HttpApi, _RateLimiter
+
+
+class FakeConnection(object):
+    _auth = None
+    _url = None
+
+    def __init__(self):
+        self.connected = False
+
+    def _connect(self):
+        self.connected = True
+        self._url = 'https://console.example.com'
+
+    def _log_messages(self, message):
+        pass
+
+    def get_option(self, option):
+        return {
+            'persistent_command_timeout': 30,
+            'validate_certs': True,
+            'use_proxy': False,
+            'remote_user': None,
+            'password': None,
+        }[option]
+
+
+class FakePool(object):
+    """Answer pooled requests with the ``(code, headers, body)`` replies in
+    turn and record the headers they were sent with."""
+
+    def __init__(self, replies):
+        self.replies = list(replies)
+        self.headers = []
+
+    def request(self, method, path, body=None, headers=None):
+        self.headers.append(headers)
+        return self.replies.pop(0)
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(consoledot.time, 'sleep', sleeps.append)
+    return sleeps
+
+
+@pytest.fixture
+def make_api(tmp_path):
+    def make_api(**options):
+        values = {
+            'offline_token': '',
+            'token_domain': 'sso.example.com',
+            'token_cache': True,
+            'token_cache_dir': str(tmp_path / 'tokens'),
+            'token_refresh_margin': 60,
+            'pool_size': 0,
+            'pool_idle_timeout': 30,
+            'retries': 3,
+            'retry_status_codes': [429, 500, 502, 503, 504],
+            'retry_backoff': 1.0,
+            'retry_backoff_max': 60.0,
+            'rate_limits': {},
+            'rate_limit_burst': None,
+            'rate_limit_state_dir': str(tmp_path / 'ratelimit'),
+            'http_cache_size': 0,
+            'http_cache_dir': None,
+            'batch_workers': 4,
+        }
+        values.update(options)
+        api = HttpApi(FakeConnection())
+        api.get_option = values.__getitem__
+        return api
+    return make_api
+
+
+def script(api, replies):
+    """Have ``api`` answer its requests with ``replies`` in turn, either
+    ``(code, headers)`` tuples or exceptions to raise."""
+    sent = []
+
+    def send(request_method, path, data, headers):
+        sent.append(request_method)
+        reply = replies.pop(0)
+        if isinstance(reply, Exception):
+            raise reply
+        code, headers = reply
+        return code, headers, json.dumps({'code': code}).encode()
+
+    api._send = send
+    return sent
+
+
+def test_retries_until_success(make_api, sleeps):
+    api = make_api()
+    script(api, [(503, {}), (502, {}), (200, {})])
+
+    code, response, meta = api.send_request('GET', '/api/edge/v1/devices', with_meta=True)
+
+    assert (code, response, meta['retries']) == (200, {'code': 200}, 2)
+    # full jitter below the exponential backoff
+    assert 0 <= sleeps[0] <= 1.0 and 0 <= sleeps[1] <= 2.0
+
+
+def test_gives_up_after_retries(make_api, sleeps):
+    api = make_api(retries=2)
+    sent = script(api, [(503, {})] * 3)
+
+    code, response, meta = api.send_request('GET', '/api/edge/v1/devices', with_meta=True)
+
+    assert (code, meta['retries'], len(sent), len(sleeps)) == (503, 2, 3, 2)
+
+
+def test_backoff_is_capped(make_api):
+    api = make_api(retry_backoff=1.0, retry_backoff_max=5.0)
+    assert all(api._retry_delay(attempt, {}) <= 5.0 for attempt in range(100))
+
+
+def test_non_idempotent_requests_only_retry_throttling(make_api, sleeps):
+    api = make_api()
+    script(api, [(503, {})])
+    assert api.send_request('POST', '/api/edge/v1/updates', data='{}')[0] == 503
+
+    script(api, [(429, {}), (200, {})])
+    assert api.send_request('POST', '/api/edge/v1/updates', data='{}')[0] == 200
+
+
+def test_connection_failures(make_api, sleeps):
+    api = make_api()
+    script(api, [AnsibleConnectionFailure('reset'), (200, {})])
+    assert api.send_request('GET', '/api/edge/v1/devices')[0] == 200
+
+    script(api, [AnsibleConnectionFailure('reset'), (200, {})])
+    with pytest.raises(AnsibleConnectionFailure):
+        api.send_request('POST', '/api/edge/v1/updates', data='{}')
+
+
+def test_retry_after(make_api, sleeps):
+    api = make_api()
+    script(api, [(429, {'Retry-After': '7'}), (200, {})])
+    assert api.send_request('GET', '/api/edge/v1/devices')[0] == 200
+    assert sleeps == [7.0]
+
+
+def test_retry_after_beyond_backoff_max(make_api, sleeps):
+    api = make_api(retry_backoff_max=10.0)
+    sent = script(api, [(429, {'Retry-After': '120'}), (200, {})])
+
+    code, response, meta = api.send_request('GET', '/api/edge/v1/devices', with_meta=True)
+
+    assert (code, meta['retries'], len(sent), sleeps) == (429, 0, 1, [])
+
+
+def test_send_requests_keeps_order_and_errors(make_api, sleeps):
+    api = make_api(retries=0)
+
+    def send(request_method, path, data, headers):
+        if path.endswith('/fail'):
+            raise AnsibleConnectionFailure('refused')
+        return 200, {}, json.dumps({'path': path}).encode()
+
+    api._send = send
+    paths = ['/api/edge/v1/devices/%d' % index for index in range(10)] + ['/api/edge/v1/devices/fail']
+
+    results = api.send_requests([{'method': 'GET', 'path': path} for path in paths])
+
+    assert [response['path'] for code, response, meta in results[:10]] == paths[:10]
+    assert results[10][:2] == [None, None]
+    assert 'refused' in results[10][2]['error']
+
+
+@pytest.mark.parametrize('max_workers, expected', [(None, 4), (8, 8), (2, 2)])
+def test_send_requests_workers(make_api, max_workers, expected):
+    api = make_api()
+    lock = threading.Lock()
+    running = [0, 0]
+
+    def send(request_method, path, data, headers):
+        with lock:
+            running[0] += 1
+            running[1] = max(running)
+        time.sleep(0.05)
+        with lock:
+            running[0] -= 1
+        return 200, {}, b'{}'
+
+    api._send = send
+    api.send_requests([{'method': 'GET', 'path': '/api/edge/v1/devices'}] * 16, max_workers=max_workers)
+
+    assert running[1] == expected
+
+
+@pytest.fixture
+def tokens(monkeypatch):
+    """Have the SSO issue access tokens t1, t2... valid for 15 minutes."""
+    issued = []
+
+    def request_token(self):
+        issued.append('t%d' % (len(issued) + 1))
+        return {'access_token': issued[-1], 'expires_at': time.time() + 900}
+
+    monkeypatch.setattr(HttpApi, '_request_token', request_token)
+    return issued
+
+
+def test_token_cache_is_shared(make_api, tokens):
+    first = make_api(offline_token='offline')
+    first._hack_the_auth()
+    second = make_api(offline_token='offline')
+    second._hack_the_auth()
+
+    assert tokens == ['t1']
+    assert second.connection._auth == {'Authorization': 'Bearer t1'}
+
+
+def test_token_cache_expired_token(make_api, tokens):
+    api = make_api(offline_token='offline')
+    api._hack_the_auth()
+    with open(api._token_cache_path(), 'w') as cache_file:
+        json.dump({'access_token': 't1', 'expires_at': time.time() + 30}, cache_file)
+
+    other = make_api(offline_token='offline')
+    other._hack_the_auth()
+
+    # a token within token_refresh_margin of its expiry is not used
+    assert other.connection._auth == {'Authorization': 'Bearer t2'}
+
+
+def test_unauthorized_request_is_replayed_once(make_api, tokens):
+    api = make_api(offline_token='offline', pool_size=1)
+    api._pool = FakePool([(401, {}, b''), (200, {}, b'{"ok": true}')])
+
+    assert api.send_request('GET', '/api/edge/v1/devices') == (200, {'ok': True})
+    assert [headers['Authorization'] for headers in api._pool.headers] == ['Bearer t1', 'Bearer t2']
+
+    api._pool = FakePool([(401, {}, b''), (401, {}, b'')])
+    assert api.send_request('GET', '/api/edge/v1/devices')[0] == 401
+    assert tokens == ['t1', 't2', 't3']
+
+
+def test_only_the_rejected_token_is_refreshed(make_api, tokens):
+    api = make_api(offline_token='offline')
+    api._hack_the_auth()
+    api._refresh_rejected_token('t1')
+    # a worker still holding t1 must not throw away t2
+    api._refresh_rejected_token('t1')
+
+    assert tokens == ['t1', 't2']
+    assert api.connection._auth == {'Authorization': 'Bearer t2'}
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(consoledot.time, 'time', lambda: now[0])
+    return now
+
+
+def test_rate_limiter(tmp_path, clock, sleeps):
+    limiter = _RateLimiter(str(tmp_path / 'state.json'), {'devices': 10}, burst=2)
+
+    waits = [limiter.acquire('devices') for request in range(4)]
+
+    assert waits == pytest.approx([0, 0, 0.1, 0.2])
+    assert sleeps == waits[2:]
+    assert limiter.acquire('inventory') == 0
+
+
+def test_rate_limiter_budget_is_shared_and_refilled(tmp_path, clock, sleeps):
+    state_path = str(tmp_path / 'state.json')
+    _RateLimiter(state_path, {'devices': 1}).acquire('devices')
+
+    assert _RateLimiter(state_path, {'devices': 1}).acquire('devices') == pytest.approx(1)
+    clock[0] += 10
+    assert _RateLimiter(state_path, {'devices': 1}).acquire('devices') == 0
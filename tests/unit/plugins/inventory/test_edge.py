@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+
+# MIT License (see LICENSE or https://opensource.org/licenses/MIT)
+
+from __future__ import absolute_import, division, print_function
+__metaclass__ = type
+
+import pytest
+
+from ansible.errors import AnsibleError
+from ansible.inventory.data import InventoryData
+from ansible.module_utils.six.moves.urllib.parse import parse_qsl, urlsplit
+from ansible.parsing.dataloader import DataLoader
+from ansible_collections.consoledot.edgemanagement.plugins.inventory.edge import InventoryModule
+
+SERVER = 'https://console.example.com'
+
+OPTIONS = {
+    'server': SERVER,
+    'user': 'user',
+    'password': 'password',
+    'selection': 'Name',
+    'vars_prefix': '',
+    'max_concurrency': 1,
+    'page_size': 2,
+    'adaptive_page_size': False,
+    'page_latency_target': 2.0,
+    'shard_count': 1,
+    'shard_index': 0,
+    'shard_by': 'uuid',
+    'delta_sync': False,
+    'cache': False,
+}
+
+
+class FakeApi(object):
+    """Edge devicesview and host inventory answering from ``devices``, a dict
+    of device names to their ipv4 address, or None when the device is not in
+    the host inventory."""
+
+    def __init__(self, devices, groups=None):
+        self.devices = devices
+        self.groups = groups or {}
+        self.updated = set()
+        self.urls = []
+
+    def device(self, name):
+        return {
+            'DeviceUUID': 'uuid-%s' % name,
+            'Name': name,
+            'DeviceGroups': [{'Name': group} for group in self.groups.get(name, [])],
+        }
+
+    def get_json(self, url):
+        self.urls.append(url)
+        parsed = urlsplit(url)
+        params = dict(parse_qsl(parsed.query))
+        if parsed.path == '/api/edge/v1/devices/devicesview':
+            offset, limit = int(params['offset']), int(params['limit'])
+            names = sorted(self.devices)
+            return {
+                'count': len(names),
+                'data': {'devices': [self.device(name) for name in names[offset:offset + limit]]},
+            }
+        if parsed.path == '/api/inventory/v1/hosts':
+            results = [{'id': 'uuid-%s' % name} for name in sorted(self.updated)]
+            return {'total': len(results), 'results': results}
+        uuids = parsed.path.split('/')[-2].split(',')
+        results = [
+            {
+                'id': uuid,
+                'system_profile': {
+                    'network_interfaces': [
+                        {'ipv4_addresses': ['127.0.0.1']},
+                        {'ipv4_addresses': [self.devices[uuid[len('uuid-'):]]]},
+                    ],
+                },
+            }
+            for uuid in uuids if self.devices[uuid[len('uuid-'):]] is not None
+        ]
+        return {'results': results}
+
+    def profile_requests(self):
+        return [url for url in self.urls if '/system_profile' in url]
+
+
+def make_plugin(api, store=None, **options):
+    plugin = InventoryModule()
+    values = dict(OPTIONS, **options)
+    plugin.get_option = values.__getitem__
+    plugin._read_config_data = lambda path: None
+    plugin._get_json = api.get_json
+    plugin._cache = {} if store is None else store
+    return plugin
+
+
+def parse(plugin, path='edge.yml', cache=True):
+    inventory = InventoryData()
+    plugin.parse(inventory, DataLoader(), path, cache=cache)
+    return inventory
+
+
+def test_parse_full_sync():
+    api = FakeApi({'a': '10.0.0.1', 'b': '10.0.0.2', 'c': '10.0.0.3', 'missing': None}, groups={'a': ['site-1']})
+    inventory = parse(make_plugin(api))
+
+    assert sorted(inventory.hosts) == ['10.0.0.1', '10.0.0.2', '10.0.0.3']
+    assert inventory.get_host('10.0.0.1').vars['ansible_host'] == 'a'
+    assert [host.name for host in inventory.groups['site_1'].get_hosts()] == ['10.0.0.1']
+    # the 4 devices are listed 2 per page
+    assert len([url for url in api.urls if 'devicesview' in url]) == 2
+
+
+def test_delta_sync_only_fetches_updated_profiles():
+    api = FakeApi({'a': '10.0.0.1', 'b': '10.0.0.2', 'missing': None})
+    store = {}
+    parse(make_plugin(api, store, cache=True, delta_sync=True))
+    (snapshot,) = store.values()
+    assert snapshot['missing'] == ['uuid-missing']
+    assert [entry['device']['Name'] for entry in snapshot['devices']] == ['a', 'b']
+
+    # b changed address, c is new and missing is still not in the host inventory
+    api.devices.update({'b': '10.0.0.20', 'c': '10.0.0.3'})
+    api.updated = set(['b'])
+    api.urls = []
+    inventory = parse(make_plugin(api, store, cache=True, delta_sync=True))
+
+    assert sorted(inventory.hosts) == ['10.0.0.1', '10.0.0.20', '10.0.0.3']
+    (profile_request,) = api.profile_requests()
+    assert 'uuid-b,uuid-c/' in profile_request
+    updated_request = [url for url in api.urls if 'updated_start=' in url][0]
+    assert dict(parse_qsl(urlsplit(updated_request).query))['updated_start'] == snapshot['synced_at']
+
+
+def test_delta_sync_drops_removed_devices():
+    api = FakeApi({'a': '10.0.0.1', 'b': '10.0.0.2'})
+    store = {}
+    parse(make_plugin(api, store, cache=True, delta_sync=True))
+
+    del api.devices['a']
+    api.urls = []
+    inventory = parse(make_plugin(api, store, cache=True, delta_sync=True))
+
+    assert sorted(inventory.hosts) == ['10.0.0.2']
+    assert api.profile_requests() == []
+
+
+def test_cached_inventory_is_used_without_delta_sync():
+    api = FakeApi({'a': '10.0.0.1'})
+    store = {}
+    parse(make_plugin(api, store, cache=True))
+    api.urls = []
+
+    inventory = parse(make_plugin(api, store, cache=True))
+
+    assert sorted(inventory.hosts) == ['10.0.0.1']
+    assert api.urls == []
+
+
+def test_shards_split_devices():
+    devices = dict(('d%d' % index, '10.0.0.%d' % index) for index in range(1, 31))
+    shards = [
+        set(parse(make_plugin(FakeApi(devices), shard_count=3, shard_index=index)).hosts)
+        for index in range(3)
+    ]
+
+    assert set().union(*shards) == set(devices.values())
+    assert sum(len(shard) for shard in shards) == len(devices)
+    assert all(shards)
+
+
+def test_shard_by_group_keeps_groups_together():
+    devices = dict(('d%d' % index, '10.0.0.%d' % index) for index in range(1, 31))
+    groups = dict(('d%d' % index, ['group-%d' % (index % 5)]) for index in range(1, 31))
+    grouped = 0
+    for index in range(3):
+        inventory = parse(make_plugin(FakeApi(devices, groups), shard_count=3, shard_index=index, shard_by='group'))
+        for name, group in inventory.groups.items():
+            if name.startswith('group_') and group.get_hosts():
+                # every device of a group ends up in the same shard
+                assert len(group.get_hosts()) == 6
+                grouped += 6
+    assert grouped == len(devices)
+
+
+@pytest.mark.parametrize('options, message', [
+    ({'shard_index': 3, 'shard_count': 3}, 'shard_index'),
+    ({'page_size': 0}, 'page_size'),
+    ({'page_latency_target': 0}, 'page_latency_target'),
+])
+def test_invalid_options(options, message):
+    with pytest.raises(AnsibleError, match=message):
+        parse(make_plugin(FakeApi({}), **options))
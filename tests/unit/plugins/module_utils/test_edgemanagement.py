@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+
+# MIT License (see LICENSE or https://opensource.org/licenses/MIT)
+
+from __future__ import absolute_import, division, print_function
+__metaclass__ = type
+
+import pytest
+
+from ansible.module_utils.six.moves.urllib.parse import parse_qsl, urlsplit
+from ansible_collections.consoledot.edgemanagement.plugins.module_utils.edgemanagement import (
+    ConsoleDotRequest,
+    EDGE_API_DEVICES,
+)
+
+
+class FailJson(Exception):
+    pass
+
+
+class FakeModule(object):
+    _socket_path = '/nonexistent'
+
+    def fail_json(self, **kwargs):
+        raise FailJson(kwargs['msg'])
+
+
+class FakeConnection(object):
+    """Answer requests with ``handler(method, path)``, which returns a
+    ``(code, response)`` tuple, and record the requested paths and the size
+    of every batch."""
+
+    def __init__(self, handler):
+        self.handler = handler
+        self.paths = []
+        self.batches = []
+
+    def send_request(self, method, path, data=None, with_meta=False):
+        self.paths.append(path)
+        code, response = self.handler(method, path)
+        return code, response, {'retries': 0}
+
+    def send_requests(self, requests, max_workers=None):
+        self.batches.append((len(requests), max_workers))
+        results = []
+        for request in requests:
+            code, response, meta = self.send_request(request['method'], request['path'])
+            results.append([code, response, {'retries': 0, 'elapsed': 0}])
+        return results
+
+
+def make_request(handler):
+    crc_request = ConsoleDotRequest(FakeModule())
+    crc_request.connection = FakeConnection(handler)
+    return crc_request
+
+
+def query(path):
+    return dict(parse_qsl(urlsplit(path).query))
+
+
+def list_endpoint(count):
+    """A listing answering a bare list of records for each page."""
+    def handler(method, path):
+        params = query(path)
+        offset, limit = int(params['offset']), int(params['limit'])
+        return 200, list(range(count))[offset:offset + limit]
+    return handler
+
+
+def total_endpoint(count):
+    """A listing answering the records of a page with their total count."""
+    def handler(method, path):
+        params = query(path)
+        offset, limit = int(params['offset']), int(params['limit'])
+        return 200, {'total': count, 'data': list(range(count))[offset:offset + limit]}
+    return handler
+
+
+@pytest.mark.parametrize('count', [0, 99, 100, 250])
+def test_get_all_list_pages(count):
+    crc_request = make_request(list_endpoint(count))
+    assert crc_request.get_all(EDGE_API_DEVICES) == list(range(count))
+
+
+@pytest.mark.parametrize('count', [0, 100, 250, 1001])
+def test_get_all_total_pages(count):
+    crc_request = make_request(total_endpoint(count))
+    assert crc_request.get_all(EDGE_API_DEVICES) == list(range(count))
+    # only the pages holding records are requested
+    assert len(crc_request.connection.paths) == max(1, -(-count // 100))
+
+
+def test_get_all_fails_on_error_page():
+    def handler(method, path):
+        if query(path)['offset'] == '200':
+            return 503, {'errors': 'unavailable'}
+        return total_endpoint(500)(method, path)
+
+    crc_request = make_request(handler)
+    with pytest.raises(FailJson, match='HTTP 503'):
+        crc_request.get_all(EDGE_API_DEVICES)
+
+
+def devicesview(count):
+    """devicesview of ``count`` devices named u0, u1..., answering lookups by
+    uuid as well as pages."""
+    devices = [{'DeviceUUID': 'u%d' % index, 'DeviceID': index} for index in range(count)]
+
+    def handler(method, path):
+        params = query(path)
+        if 'uuid' in params:
+            found = [device for device in devices if device['DeviceUUID'] == params['uuid']]
+            return 200, {'count': len(found), 'data': {'devices': found}}
+        offset, limit = int(params['offset']), int(params['limit'])
+        return 200, {'count': count, 'data': {'devices': devices[offset:offset + limit]}}
+    return handler
+
+
+def lookups(crc_request):
+    return [path for path in crc_request.connection.paths if 'uuid=' in path]
+
+
+def walked_pages(crc_request):
+    return [query(path)['offset'] for path in crc_request.connection.paths if 'offset=' in path]
+
+
+def test_get_edge_systems_single_lookup():
+    crc_request = make_request(devicesview(1000))
+    assert crc_request.get_edge_systems(['u500']) == {'u500': {'DeviceUUID': 'u500', 'DeviceID': 500}}
+    assert crc_request.connection.paths == ['/api/edge/v1/devices/devicesview?uuid=u500']
+
+
+def test_get_edge_systems_few_uuids_are_looked_up():
+    crc_request = make_request(devicesview(1000))
+
+    edge_systems = crc_request.get_edge_systems(['u5', 'u500', 'u900', 'unknown'])
+
+    assert sorted(edge_systems) == ['u5', 'u500', 'u900']
+    # u5 is on the first page, the others are cheaper to look up than 9 pages
+    assert walked_pages(crc_request) == ['0']
+    assert len(lookups(crc_request)) == 3
+
+
+def test_get_edge_systems_walks_until_found():
+    crc_request = make_request(devicesview(1000))
+    uuids = ['u%d' % index for index in range(100, 450, 10)]
+
+    edge_systems = crc_request.get_edge_systems(uuids)
+
+    assert sorted(edge_systems) == sorted(uuids)
+    assert lookups(crc_request) == []
+    # pages are fetched in waves of prefetch pages, the walk stops after the
+    # wave holding u440
+    assert walked_pages(crc_request) == ['0', '100', '200', '300', '400']
+
+
+def test_get_edge_systems_resumes_the_walk():
+    crc_request = make_request(devicesview(1000))
+    chunks = [['u%d' % index for index in range(start, start + 100)] for start in range(0, 1000, 100)]
+
+    for chunk in chunks:
+        assert sorted(crc_request.get_edge_systems(chunk)) == sorted(chunk)
+
+    # every page is requested once across the calls
+    assert sorted(walked_pages(crc_request), key=int) == [str(offset) for offset in range(0, 1000, 100)]
+    assert lookups(crc_request) == []
+
+
+@pytest.mark.parametrize('max_workers, chunks', [(None, [16, 16, 8]), (2, [8, 8, 8, 8, 8]), (10, [40])])
+def test_batch_chunks(max_workers, chunks):
+    crc_request = make_request(lambda method, path: (200, {'path': path}))
+
+    with crc_request.batch(max_workers=max_workers) as batch:
+        for index in range(40):
+            batch.get('/api/edge/v1/devices/%d' % index)
+
+    assert [size for size, workers in crc_request.connection.batches] == chunks
+    assert [response['path'] for response in batch.responses] == [
+        '/api/edge/v1/devices/%d' % index for index in range(40)
+    ]
+    assert crc_request.stats['requests'] == 40
+
+
+def test_batch_uses_cache():
+    crc_request = make_request(lambda method, path: (200, {'path': path}))
+    crc_request.cache = True
+    crc_request.get('/api/edge/v1/devices/1')
+
+    with crc_request.batch() as batch:
+        batch.get('/api/edge/v1/devices/1')
+        batch.get('/api/edge/v1/devices/2')
+
+    assert crc_request.connection.batches == [(1, None)]
+    assert batch.responses == [{'path': '/api/edge/v1/devices/1'}, {'path': '/api/edge/v1/devices/2'}]
+
+
+def test_batch_failures():
+    crc_request = make_request(None)
+    crc_request.connection.send_requests = lambda requests, max_workers=None: [
+        [None, None, {'retries': 0, 'elapsed': 0, 'error': 'refused'}] for request in requests
+    ]
+
+    with crc_request.batch(fail_on_error=False) as batch:
+        batch.post('/api/edge/v1/updates', data='{}')
+    assert batch.results[0]['error'] == 'refused'
+
+    with pytest.raises(FailJson, match='refused'):
+        with crc_request.batch() as batch:
+            batch.post('/api/edge/v1/updates', data='{}')
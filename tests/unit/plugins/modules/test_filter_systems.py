@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+
+# MIT License (see LICENSE or https://opensource.org/licenses/MIT)
+
+from __future__ import absolute_import, division, print_function
+__metaclass__ = type
+
+import pytest
+
+from ansible_collections.consoledot.edgemanagement.plugins.modules.filter_systems import (
+    compile_ipv4_patterns,
+    ipv4_matches,
+)
+
+
+def matches(patterns, ip):
+    return ipv4_matches(ip, compile_ipv4_patterns(patterns))
+
+
+@pytest.mark.parametrize('ip, expected', [
+    ('192.168.122.22', True),
+    ('192.168.122.199', True),
+    ('192.168.122.21', False),
+    ('192.168.122.200', False),
+    ('192.168.123.50', False),
+])
+def test_octet_range(ip, expected):
+    assert matches(['192.168.122.[22:199]'], ip) is expected
+
+
+@pytest.mark.parametrize('ip, expected', [
+    ('10.0.0.0', True),
+    ('10.0.255.255', True),
+    ('10.1.0.0', False),
+])
+def test_cidr(ip, expected):
+    assert matches(['10.0.5.0/16'], ip) is expected
+
+
+def test_any_octet():
+    assert matches(['192.168.[].1'], '192.168.77.1')
+    assert not matches(['192.168.[].1'], '192.168.77.2')
+    assert matches(['[].[].[].[]'], '8.8.8.8')
+
+
+def test_any_pattern_matches():
+    patterns = ['10.0.0.0/24', '192.168.1.[1:10]']
+    assert matches(patterns, '10.0.0.200')
+    assert matches(patterns, '192.168.1.5')
+    assert not matches(patterns, '192.168.1.11')
+
+
+def test_adjacent_ranges_are_merged():
+    starts, ends, octet_patterns = compile_ipv4_patterns(['10.0.0.[0:9]', '10.0.0.[10:20]', '10.0.0.[5:15]'])
+    assert len(starts) == len(ends) == 1
+    assert octet_patterns == []
+
+
+def test_wide_pattern_falls_back_to_octets():
+    compiled = compile_ipv4_patterns(['[0:200].[0:200].[0:200].5'])
+    assert compiled[0] == []
+    assert len(compiled[2]) == 1
+    assert ipv4_matches('1.2.3.5', compiled)
+    assert not ipv4_matches('1.2.3.6', compiled)
+    assert not ipv4_matches('201.2.3.5', compiled)
+
+
+@pytest.mark.parametrize('ip', ['not-an-ip', '', '::1'])
+def test_invalid_address(ip):
+    assert not matches(['[].[].[].[]'], ip)
+
+
+@pytest.mark.parametrize('pattern', ['192.168.1', '192.168.1.256', '192.168.[9:1].1', '10.0.0.0/33', 'a.b.c.d'])
+def test_invalid_pattern(pattern):
+    with pytest.raises(ValueError, match='Invalid ipv4 pattern'):
+        compile_ipv4_patterns([pattern])
+
+
+def test_empty_patterns_are_ignored():
+    assert compile_ipv4_patterns(['', '  ']) == ([], [], [])
+    assert matches(['', ' 10.0.0.1 '], '10.0.0.1')